@@ -1,24 +1,50 @@
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import functools
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import json
 import os
 import shutil
-from datetime import datetime, timedelta
-from typing import Optional, Literal, List, Union
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import zlib
+from abc import ABC, abstractmethod
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Optional, Literal, List, Union, Dict, Tuple, Iterator, Set, Callable, Awaitable
 
 from alembic.util import AutogenerateDiffsDetected, CommandError
 from discord.abc import Snowflake
 
 from alembic import command as alembic_command
 from alembic.config import Config as AlembicConfig
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
 
+import aiohttp
 import discord
 import sqlalchemy
+from aiohttp import web
 import yaml
 from discord import app_commands, Object
 from discord.app_commands import Choice
-from discord.ext import commands
-from sqlalchemy import create_engine, Column, Integer, DateTime, func, JSON, BLOB
+from discord.ext import commands, tasks
+from sqlalchemy import create_engine, Column, Integer, BigInteger, DateTime, func, JSON, String, select, delete, update, text, Index, bindparam
 from sqlalchemy.orm import sessionmaker, declarative_base
 import re
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 BUILD_DATE = os.getenv('BUILD_DATE', None)
 VERSION = os.getenv('VERSION', None)
@@ -29,7 +55,44 @@ intents.guild_messages = True
 intents.members = True
 intents.message_content = True
 
-bot = commands.Bot(command_prefix="!", intents=intents, help_command=None)
+# REST request tracing for the metrics endpoint, the callbacks are added once the metrics are set up
+http_trace = aiohttp.TraceConfig()
+
+class ModLogBot(commands.Bot):
+    async def setup_hook(self) -> None:
+        with startup_phase("Loading recent actions"):
+            await action_counters.rebuild()
+        with startup_phase("Loading pending deletions"):
+            await deletion_scheduler.load()
+        log_queue.start()
+        deletion_scheduler.start()
+        retention_worker.start()
+        db_size_worker.start()
+        wal_checkpoint_worker.start()
+        backup_worker.start()
+        await metrics_server.start()
+        loop_watchdog.start()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            pass # Signal handlers are not available on Windows
+
+    async def close(self) -> None:
+        retention_worker.cancel()
+        db_size_worker.cancel()
+        wal_checkpoint_worker.cancel()
+        backup_worker.cancel()
+        await deletion_scheduler.stop()
+        await message_delete_coalescer.flush()
+        # Send what is still queued so the message IDs make it into the final flush
+        await log_dispatcher.drain(timeout=10)
+        await log_queue.stop()
+        await metrics_server.stop()
+        await loop_watchdog.stop()
+        event_trace.close()
+        await super().close()
+
+bot = ModLogBot(command_prefix="!", intents=intents, help_command=None, http_trace=http_trace)
 
 class ActionType:
     UNKNOWN = 0
@@ -64,15 +127,25 @@ class Config_AutoMessageRemoval(BaseModel):
     removal_delay_seconds: Optional[float] = None
     response_message: Optional[str] = None
 
+class AutoMessageRemovalRule:
+    """An auto message removal config with its regex patterns compiled once at load time."""
+    def __init__(self, config: Config_AutoMessageRemoval):
+        self.config = config
+        self.channel_id = config.channel_id
+        self.matching = re.compile(config.regex_matching) if config.regex_matching is not None else None
+        self.not_matching = re.compile(config.regex_not_matching) if config.regex_not_matching is not None else None
+
+    def should_remove(self, content: str) -> bool:
+        if self.matching is not None and self.matching.match(content) is None:
+            return False # setting is set and NOT matched, so we ignore this message
+        if self.not_matching is not None and self.not_matching.match(content) is not None:
+            return False # setting is set and matched, so we ignore this message
+        return True
+
 config_folder_path = os.environ.get("CONFIG_FOLDER_PATH", "/config/")
 
-# Database setup
 if config_folder_path != "":
     os.makedirs(config_folder_path, exist_ok=True)
-Base = declarative_base()
-engine = create_engine(f"sqlite:///{config_folder_path}mod_logs.db")
-Session = sessionmaker(bind=engine)
-session = Session()
 
 # Config setup
 if not os.path.exists(f'{config_folder_path}config.yml'):
@@ -84,6 +157,490 @@ def load_config():
     return config
 config = load_config()
 
+# Buckets in seconds, from a fast SQLite query up to a slow REST call behind a rate limit
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+class Metrics:
+    """Counters and latency histograms rendered in the Prometheus text format.
+
+    Metrics are created on first use and keyed by name and labels. SQL timings are recorded from the database
+    threads, so updates take a lock. `collect` adds gauges read from other objects' `stats()` when rendering.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+        self._histograms: Dict[str, Dict[Tuple[Tuple[str, str], ...], Histogram]] = {}
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+
+    def describe(self, name: str, metric_type: str, description: str) -> None:
+        self._help[name] = (metric_type, description)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def collect(self, prefix: str, stats: Callable[[], dict]) -> None:
+        """Report the numeric values of `stats()` as `{prefix}_{key}` gauges."""
+        self._collectors[prefix] = stats
+
+    @staticmethod
+    def _labels(labels: Tuple[Tuple[str, str], ...], *extra: Tuple[str, str]) -> str:
+        pairs = [*labels, *extra]
+        if not pairs:
+            return ""
+        escaped = []
+        for name, value in pairs:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{name}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def _header(self, lines: List[str], name: str, default_type: str) -> None:
+        metric_type, description = self._help.get(name, (default_type, ""))
+        if description:
+            lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in self._counters.items():
+                self._header(lines, name, "counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+            for name, series in self._histograms.items():
+                self._header(lines, name, "histogram")
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(labels, ('le', str(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{self._labels(labels, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        for prefix, stats in self._collectors.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    name = f"{prefix}_{key}"
+                    self._header(lines, name, "gauge")
+                    lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe("modlog_handler_seconds", "histogram", "Time spent in event handlers and slash commands")
+metrics.describe("modlog_handler_calls_total", "counter", "Event handler and slash command invocations by outcome")
+metrics.describe("modlog_sql_statement_seconds", "histogram", "Time spent executing SQL statements")
+metrics.describe("modlog_rest_requests_total", "counter", "Discord REST requests by method and status")
+metrics.describe("modlog_rest_rate_limited_total", "counter", "Discord REST requests answered with 429 Too Many Requests")
+
+class InvocationProfile:
+    """Wall time of one handler invocation, split into the phases recorded with `profile_phase`.
+
+    Phases are inclusive and can overlap when the handler runs them concurrently.
+    """
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.started_at = datetime.now()
+        self.seconds = 0.0
+        self.phases: Dict[str, float] = {}
+        self.finished = False
+
+    def add(self, phase: str, seconds: float) -> None:
+        # Tasks started by the handler inherit its context and can outlive it
+        if not self.finished:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+current_profile: contextvars.ContextVar[Optional[InvocationProfile]] = contextvars.ContextVar("current_profile", default=None)
+
+@contextlib.contextmanager
+def profile_phase(phase: str):
+    """Add the time spent in the block to `phase` of the current handler invocation, if there is one."""
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(phase, time.perf_counter() - start)
+
+class SlowInvocations:
+    """Keeps the `size` slowest handler invocations since startup."""
+    def __init__(self, size: int = 10):
+        self.size = size
+        self._heap: List[Tuple[float, int, InvocationProfile]] = []
+        self._counter = 0
+
+    def record(self, profile: InvocationProfile) -> None:
+        self._counter += 1
+        item = (profile.seconds, self._counter, profile)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, item)
+        elif item[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def slowest(self) -> List[InvocationProfile]:
+        return [profile for _, _, profile in sorted(self._heap, reverse=True)]
+
+slow_invocations = SlowInvocations(config.get("perf_slow_invocations", 10))
+
+def instrumented(handler: str):
+    """Count calls of the decorated coroutine, record how long they take under `handler` and profile their phases.
+
+    Goes directly above the function, below `@bot.event` or the app command decorators.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            profile = InvocationProfile(handler)
+            token = current_profile.set(profile)
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = await func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                profile.seconds = time.perf_counter() - start
+                profile.finished = True
+                current_profile.reset(token)
+                slow_invocations.record(profile)
+                metrics.observe("modlog_handler_seconds", profile.seconds, handler=handler)
+                metrics.inc("modlog_handler_calls_total", handler=handler, outcome=outcome)
+        return wrapper
+    return decorator
+
+class LoopLagWatchdog:
+    """Measures how late the event loop runs a task that wakes up every `interval` seconds.
+
+    A separate thread watches the task's heartbeat, when the loop hasn't run it for `threshold` seconds
+    the loop thread is stuck in blocking code, and its stack is captured while it is still blocked.
+    """
+    def __init__(self, interval: float = 0.5, threshold: float = 0.5, max_stalls: int = 5):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: deque = deque(maxlen=max_stalls)
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            self.last_lag_seconds = lag
+            self.max_lag_seconds = max(self.max_lag_seconds, lag)
+            metrics.observe("modlog_event_loop_lag_seconds", lag)
+
+    def _watch(self) -> None:
+        captured_for = None
+        while not self._stop.wait(self.interval / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or captured_for == heartbeat:
+                continue
+            # Only one capture per stall, the stack is taken while the loop is still blocked
+            captured_for = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            self.stalls.append((datetime.now(), blocked, stack))
+            metrics.inc("modlog_event_loop_stalls_total")
+            print(f"Event loop blocked for at least {blocked:.2f}s in:\n{stack}")
+
+    def stats(self) -> dict:
+        return {
+            "last_lag_seconds": self.last_lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+        }
+
+loop_watchdog = LoopLagWatchdog(threshold=config.get("perf_loop_lag_threshold_seconds", 0.5))
+metrics.describe("modlog_event_loop_lag_seconds", "histogram", "How late the event loop ran a periodic task")
+metrics.describe("modlog_event_loop_stalls_total", "counter", "Times the event loop was blocked past the lag threshold")
+metrics.collect("modlog_event_loop", loop_watchdog.stats)
+
+def instrument_sql(engine: sqlalchemy.Engine) -> None:
+    """Time every statement executed on `engine`, labelled with its SQL verb."""
+    @sqlalchemy.event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @sqlalchemy.event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        metrics.observe("modlog_sql_statement_seconds", elapsed, statement=verb)
+
+    @sqlalchemy.event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # Failed statements never reach after_cursor_execute, drop their start time so it isn't used for the next one
+        conn = exception_context.connection
+        if conn is not None and exception_context.execution_context is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+async def on_rest_request_end(session, context, params: aiohttp.TraceRequestEndParams) -> None:
+    status = params.response.status
+    metrics.inc("modlog_rest_requests_total", method=params.method, status=str(status))
+    if status == 429:
+        metrics.inc("modlog_rest_rate_limited_total", method=params.method)
+
+async def on_rest_request_exception(session, context, params: aiohttp.TraceRequestExceptionParams) -> None:
+    metrics.inc("modlog_rest_requests_total", method=params.method, status="error")
+
+http_trace.on_request_end.append(on_rest_request_end)
+http_trace.on_request_exception.append(on_rest_request_exception)
+
+class MetricsServer:
+    """Serves `metrics` at /metrics on the bot's event loop, only when `metrics_port` is set."""
+    def __init__(self, host: str, port: Optional[int]):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"Cache-Control": "no-store"})
+
+    async def start(self) -> None:
+        if self.port is None or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+metrics_server = MetricsServer(config.get("metrics_host") or "127.0.0.1", config.get("metrics_port"))
+
+# SQLite PRAGMAs applied to every new database connection
+SQLITE_PROFILES = {
+    # SQLite's own defaults: rollback journal, full sync on every commit
+    "default": {},
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -16000, # KiB when negative
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+def get_sqlite_pragmas() -> dict:
+    profile = config.get("db_sqlite_profile", "performance")
+    if profile not in SQLITE_PROFILES:
+        print(f"Unknown SQLite profile `{profile}`. Using the `default` profile.")
+        profile = "default"
+    return {**SQLITE_PROFILES[profile], **(config.get("db_sqlite_pragmas") or {})}
+
+def apply_sqlite_pragmas(engine: sqlalchemy.Engine, pragmas: dict) -> None:
+    """Run `PRAGMA name=value` for each of `pragmas` on every new connection of `engine`."""
+    @sqlalchemy.event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def get_db_url() -> str:
+    """The database URL from the DATABASE_URL environment variable or `db_url`, defaulting to SQLite in the config folder."""
+    return os.getenv("DATABASE_URL") or config.get("db_url") or f"sqlite:///{config_folder_path}mod_logs.db"
+
+def get_db_pool_size() -> int:
+    """Connections kept in the pool, databases other than SQLite get as many database threads."""
+    return config.get("db_pool_size") or 5
+
+def get_engine_options() -> dict:
+    """Connection pool settings from config.yml, the pool size and the other ones that are set."""
+    options = {
+        "pool_size": get_db_pool_size(),
+        "max_overflow": config.get("db_max_overflow"),
+        "pool_recycle": config.get("db_pool_recycle_seconds"),
+        "pool_pre_ping": config.get("db_pool_pre_ping"),
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
+# Database setup
+DB_URL = get_db_url()
+Base = declarative_base()
+engine = create_engine(DB_URL, **get_engine_options())
+is_sqlite = engine.dialect.name == "sqlite"
+if is_sqlite:
+    apply_sqlite_pragmas(engine, get_sqlite_pragmas())
+instrument_sql(engine)
+Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+# Discord IDs don't fit in a 32 bit INTEGER, SQLite's INTEGER is already 64 bit
+SnowflakeID = Integer().with_variant(BigInteger(), "postgresql", "mysql", "mariadb")
+
+# All database work runs on dedicated threads so SQL never blocks the discord.py event loop.
+# SQLite gets a single worker to keep writes serialised, and every call gets its own session.
+db_executor = ThreadPoolExecutor(
+    max_workers=1 if is_sqlite else get_db_pool_size(),
+    thread_name_prefix="db",
+)
+
+async def run_db(func, *args, **kwargs):
+    """Run `func(session, *args, **kwargs)` on the database thread with a fresh session."""
+    def run():
+        with Session() as session:
+            return func(session, *args, **kwargs)
+    with profile_phase("db"):
+        return await asyncio.get_running_loop().run_in_executor(db_executor, run)
+
+class SqliteBackup:
+    """Online backups of the SQLite database through SQLite's backup API, consistent while the bot keeps writing.
+
+    In WAL mode the copy is one read transaction, which writers don't wait for. Otherwise pages are copied
+    `pages_per_step` at a time with a short sleep in between, so writers are only held up for one step at a time.
+    Backups are named `<database>.<time>.<label>.db`, gzipped when `compress` is set, and only the newest `keep`
+    of each label are kept.
+    """
+    def __init__(self, db_path: str, folder: str, keep: int = 7, compress: bool = False, pages_per_step: int = 1024, step_sleep: float = 0.01):
+        self.db_path = db_path
+        self.folder = folder
+        self.keep = keep
+        self.compress = compress
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.stem = os.path.splitext(os.path.basename(db_path))[0]
+
+        self.backups_total = 0
+        self.last_backup_seconds = 0.0
+        self.last_backup_bytes = 0
+
+    def backup(self, label: str) -> str:
+        """Back up the database and rotate older backups with the same label, returns the backup's path."""
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f"{self.stem}.{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.{label}.db")
+        if self.compress:
+            path += ".gz"
+
+        start = time.perf_counter()
+        fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        os.close(fd)
+        try:
+            source = sqlite3.connect(self.db_path)
+            destination = sqlite3.connect(temp_path)
+            try:
+                # Writes from other connections restart a stepped backup, under WAL one step never has to restart
+                wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+                source.backup(destination, pages=-1 if wal else self.pages_per_step, sleep=self.step_sleep)
+            finally:
+                destination.close()
+                source.close()
+            if self.compress:
+                with open(temp_path, "rb") as raw, gzip.open(f"{temp_path}.gz", "wb") as compressed:
+                    shutil.copyfileobj(raw, compressed)
+                os.replace(f"{temp_path}.gz", temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        elapsed = time.perf_counter() - start
+
+        size = os.path.getsize(path)
+        self.backups_total += 1
+        self.last_backup_seconds = elapsed
+        self.last_backup_bytes = size
+        metrics.observe("modlog_db_backup_seconds", elapsed)
+        print(f"Backed up the database to {path} ({size / (1024 * 1024):.2f}MB) in {elapsed:.2f}s.")
+        self._rotate(label)
+        return path
+
+    def _rotate(self, label: str) -> None:
+        # The timestamp in the name sorts oldest first
+        backups = sorted(glob.glob(os.path.join(glob.escape(self.folder), f"{glob.escape(self.stem)}.*.{label}.db*")))
+        for old_backup in backups[:-self.keep] if self.keep > 0 else []:
+            os.remove(old_backup)
+            print(f"Removed old backup {old_backup}.")
+
+    def stats(self) -> dict:
+        return {
+            "backups_total": self.backups_total,
+            "last_backup_seconds": self.last_backup_seconds,
+            "last_backup_bytes": self.last_backup_bytes,
+        }
+
+db_backup = None
+if is_sqlite and engine.url.database not in (None, "", ":memory:"):
+    db_backup = SqliteBackup(
+        engine.url.database,
+        config.get("db_backup_folder") or f"{config_folder_path}backups",
+        keep=config.get("db_backup_keep", 7),
+        compress=config.get("db_backup_compress", False),
+        pages_per_step=config.get("db_backup_pages_per_step", 1024),
+    )
+    metrics.describe("modlog_db_backup_seconds", "histogram", "Time taken by SQLite backups")
+    metrics.collect("modlog_db_backup", db_backup.stats)
+
 BOT_TOKEN = os.getenv('BOT_TOKEN', None)
 if BOT_TOKEN is None:
     try:
@@ -130,10 +687,24 @@ def load_servers():
                     except (ValueError, TypeError):
                         print(f"Ignored Channel ID `{ignored_channel}` is not a valid channel ID. Skipping channel.")
             
-            auto_message_removals = []
+            auto_message_removals = {}
             if "auto_message_removals" in config["servers"][server]:
                 for auto_message_removal in config["servers"][server]["auto_message_removals"]:
-                    auto_message_removals.append(Config_AutoMessageRemoval(**auto_message_removal))
+                    try:
+                        rule = AutoMessageRemovalRule(Config_AutoMessageRemoval(**auto_message_removal))
+                    except (ValidationError, re.error) as e:
+                        print(f"Invalid auto message removal `{auto_message_removal}` for server `{server}`. Skipping rule. ({e})")
+                        continue
+                    auto_message_removals.setdefault(rule.channel_id, []).append(rule)
+
+            message_delete_coalesce_seconds = config["servers"][server].get("message_delete_coalesce_seconds", None)
+            if message_delete_coalesce_seconds is None:
+                message_delete_coalesce_seconds = config.get("message_delete_coalesce_seconds", 0)
+            try:
+                message_delete_coalesce_seconds = float(message_delete_coalesce_seconds or 0)
+            except (ValueError, TypeError):
+                print(f"Message delete coalesce window `{message_delete_coalesce_seconds}` is not a number. Coalescing disabled for server `{server}`.")
+                message_delete_coalesce_seconds = 0
 
             servers[server] = {
                 "name": server,
@@ -142,63 +713,188 @@ def load_servers():
                 "report_role_ping_id": report_role_ping_id,
                 "ignored_channels": ignored_channels,
                 "auto_message_removals": auto_message_removals,
+                "message_delete_coalesce_seconds": message_delete_coalesce_seconds,
             }
     return servers
 SERVERS = None
 
+class AttachmentStore(ABC):
+    """Storage for log attachments, addressed by the SHA-256 hash of their content."""
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """Store `data` if it isn't stored already, returns its hash."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def keys(self, older_than: Optional[datetime] = None) -> Iterator[str]:
+        """Iterate over stored hashes, optionally only those stored before `older_than`."""
+
+class FileAttachmentStore(AttachmentStore):
+    """Stores attachments as files under `root`, optionally zlib compressed, sharded by the first two hash characters."""
+    COMPRESSED_SUFFIX = ".z"
+
+    def __init__(self, root: str, compress: bool = False):
+        self.root = root
+        self.compress = compress
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, data: bytes) -> str:
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        for existing in (path, path + self.COMPRESSED_SUFFIX):
+            try:
+                # The log referencing it may not be committed yet, make it recent again so garbage collection skips it
+                os.utime(existing)
+                return key
+            except FileNotFoundError:
+                pass
+
+        if self.compress:
+            data = zlib.compress(data)
+            path += self.COMPRESSED_SUFFIX
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a partial attachment behind
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return key
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+        if os.path.exists(path + self.COMPRESSED_SUFFIX):
+            with open(path + self.COMPRESSED_SUFFIX, "rb") as f:
+                return zlib.decompress(f.read())
+        return None
+
+    def delete(self, key: str) -> None:
+        for path in (self._path(key), self._path(key) + self.COMPRESSED_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def keys(self, older_than: Optional[datetime] = None) -> Iterator[str]:
+        if not os.path.isdir(self.root):
+            return
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for file in os.scandir(shard.path):
+                if older_than is not None and datetime.fromtimestamp(file.stat().st_mtime) >= older_than:
+                    continue
+                key = file.name.removesuffix(self.COMPRESSED_SUFFIX)
+                if len(key) == 64:
+                    yield key
+
+attachment_store: AttachmentStore = FileAttachmentStore(
+    f"{config_folder_path}attachments",
+    compress=config.get("attachment_compression", False),
+)
+
 # Log model
 class Log(Base):
     __tablename__ = "logs"
     log_id = Column(Integer, primary_key=True, autoincrement=True)
     log_time = Column(DateTime, nullable=False)
-    guild_id = Column(Integer, nullable=False)
-    mod_user_id = Column(Integer, nullable=True)
-    target_user_id = Column(Integer, nullable=True)
-    log_message_id = Column(Integer, nullable=True)
+    guild_id = Column(SnowflakeID, nullable=False)
+    mod_user_id = Column(SnowflakeID, nullable=True)
+    target_user_id = Column(SnowflakeID, nullable=True)
+    log_message_id = Column(SnowflakeID, nullable=True)
     action_type = Column(Integer, nullable=False)
     log_data = Column(JSON, nullable=False)
-    log_attachment = Column(BLOB, nullable=True)
+    log_attachment_hash = Column(String(64), nullable=True) # Key of the attachment in attachment_store
+
+    __table_args__ = (
+        # /history pages, in (log_time, log_id) order: SQLite's rowid after log_time is the log_id tiebreak
+        Index("ix_logs_guild_target_time", "guild_id", "target_user_id", "log_time"),
+        # Oldest log in a guild
+        Index("ix_logs_guild_time", "guild_id", "log_time"),
+        # Retention
+        Index("ix_logs_log_time", "log_time"),
+    )
+
+# Messages waiting to be deleted by the deletion scheduler, kept so they survive a restart
+class PendingDeletion(Base):
+    __tablename__ = "pending_deletions"
+    message_id = Column(SnowflakeID, primary_key=True, autoincrement=False)
+    channel_id = Column(SnowflakeID, nullable=False)
+    delete_at = Column(DateTime, nullable=False)
 
 # Check if DB file exists
-if not os.path.exists(f"{config_folder_path}mod_logs.db"):
-    new_db = True
+if is_sqlite:
+    new_db = engine.url.database in (None, "", ":memory:") or not os.path.exists(engine.url.database)
 else:
-    new_db = False
+    new_db = not sqlalchemy.inspect(engine).has_table(Log.__tablename__)
 
 # Create the table
 Base.metadata.create_all(engine)
 
-def upgrade_db():
+@contextlib.contextmanager
+def startup_phase(name: str):
+    """Log how long a step of starting the bot takes."""
+    start = time.perf_counter()
+    yield
+    print(f"{name} took {time.perf_counter() - start:.2f}s.")
+
+def get_schema_revisions(alembic_cfg: AlembicConfig) -> Tuple[Set[str], Set[str]]:
+    """The revisions stamped in the database's alembic_version table and the heads of the migration scripts."""
+    script_heads = set(ScriptDirectory.from_config(alembic_cfg).get_heads())
+    with engine.connect() as conn:
+        current = set(MigrationContext.configure(conn).get_current_heads())
+    return current, script_heads
+
+def upgrade_db(full_check: bool = False) -> bool:
+    """Upgrade the database to the latest migration, returns whether it was already up to date.
+
+    By default the revision stamped in the database is compared with the migration head, which takes a single query.
+    `full_check` compares the actual schema with the models through alembic's autogenerate diff instead.
+    """
     alembic_cfg = AlembicConfig("alembic.ini")
-    alembic_cfg.set_main_option("sqlalchemy.url", f"sqlite:///{config_folder_path}mod_logs.db")
+    # Escape % so ConfigParser interpolation leaves URL-encoded passwords alone
+    alembic_cfg.set_main_option("sqlalchemy.url", DB_URL.replace("%", "%%"))
 
     if new_db:
         alembic_command.stamp(alembic_cfg, "head")
         print("New database created. No upgrade needed.")
-        return
+        return True
 
-    try:
-        alembic_command.check(alembic_cfg)
-        upgrade_needed = False
-    except (AutogenerateDiffsDetected, CommandError):
-        upgrade_needed = True
+    if full_check:
+        try:
+            alembic_command.check(alembic_cfg)
+            upgrade_needed = False
+        except (AutogenerateDiffsDetected, CommandError):
+            upgrade_needed = True
+    else:
+        current, script_heads = get_schema_revisions(alembic_cfg)
+        upgrade_needed = current != script_heads
 
     if upgrade_needed:
-        print("Database is out of date. Backing up...")
-        backup_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        shutil.copy2(f"{config_folder_path}mod_logs.db", f"{config_folder_path}mod_logs.db.{backup_time}.bak")
-
-        db_size = os.path.getsize(f"{config_folder_path}mod_logs.db")
-        backup_size = os.path.getsize(f"{config_folder_path}mod_logs.db.{backup_time}.bak")
-        if backup_size != db_size:
-            print(f"Error backing up database. Backup size `{backup_size}` does not match original size `{db_size}`.")
-            return
-
-        print("Backing up complete. Upgrading database...")
+        if db_backup is not None:
+            print("Database is out of date. Backing up...")
+            try:
+                db_backup.backup("pre-upgrade")
+            except (sqlite3.Error, OSError) as e:
+                print(f"Error backing up database, not upgrading: {e}")
+                return False
+            print("Backing up complete. Upgrading database...")
+        else:
+            print(f"Database is out of date. Automatic backups are only supported for SQLite, make sure the {engine.dialect.name} database is backed up. Upgrading database...")
         alembic_command.upgrade(alembic_cfg, "head")
         print("Upgrade complete.")
-    else:
-        print("Database is up to date.")
+        return False
+    print("Database is up to date.")
+    return True
 
 def verify_db_tables(conn, metadata):
     """checks that the tables declared in metadata are actually in the db"""
@@ -215,33 +911,661 @@ def verify_db_tables(conn, metadata):
                 raise Exception("column %s.%s is %s but expected %s" %
                                 (table.key, column.name, check_column.type, column.type))
 
-def delete_old_logs():
+def insert_logs(session, rows: List[dict]) -> List[int]:
+    """Insert log rows with a single Core executemany, returns the new log IDs in the same order as `rows`."""
+    if not rows:
+        return []
+    statement = Log.__table__.insert().returning(Log.__table__.c.log_id, sort_by_parameter_order=True)
+    log_ids = session.connection().execute(statement, rows).scalars().all()
+    session.commit()
+    return log_ids
+
+def save_logs(session, logs: List[Log], sent: List[Log] = ()):
+    """Insert new `Log` objects through `insert_logs`, skipping the ORM unit of work, and set their IDs.
+
+    `sent` are logs that were already written before their log message was sent, their `log_message_id` is
+    updated in the same transaction.
+    """
+    if sent:
+        table = Log.__table__
+        session.connection().execute(
+            update(table).where(table.c.log_id == bindparam("b_log_id")).values(log_message_id=bindparam("b_log_message_id")),
+            [{"b_log_id": log.log_id, "b_log_message_id": log.log_message_id} for log in sent],
+        )
+    columns = [column.key for column in Log.__table__.columns if column.key != "log_id"]
+    log_ids = insert_logs(session, [{column: getattr(log, column) for column in columns} for log in logs])
+    for log, log_id in zip(logs, log_ids):
+        log.log_id = log_id
+    session.commit()
+
+def get_oldest_log_time(session, guild_id: int) -> Optional[datetime]:
+    return session.query(func.min(Log.log_time)).filter(Log.guild_id == guild_id).scalar()
+
+def get_history_page(
+        session,
+        guild_id: int,
+        target_user_id: int,
+        since: datetime,
+        limit: int,
+        after: Optional[Tuple[datetime, int]] = None,
+        with_counts: bool = False,
+) -> Tuple[list, Dict[int, int]]:
+    """Returns up to `limit` of the user's history rows after the `(log_time, log_id)` keyset `after`.
+
+    Only the columns needed to list the history are selected. With `with_counts`, the per-action totals for the
+    whole history are computed by window functions in the same query. Their window is ordered like the page, so
+    both are read in index order without a sort.
+    """
+    action_types = list(HISTORY_ACTION_TEXT)
+    columns = [Log.log_id, Log.log_time, Log.action_type, Log.log_message_id]
+    if with_counts:
+        columns += [
+            func.sum(sqlalchemy.case((Log.action_type == action_type, 1), else_=0))
+            .over(order_by=(Log.log_time, Log.log_id), rows=(None, None))
+            .label(f"count_{action_type}")
+            for action_type in action_types
+        ]
+
+    query = (
+        session.query(*columns)
+        .filter(Log.guild_id == guild_id)
+        .filter(Log.target_user_id == target_user_id)
+        .filter(Log.log_time >= since)
+        .filter(Log.action_type.in_(action_types))
+    )
+    if after is not None:
+        query = query.filter(sqlalchemy.tuple_(Log.log_time, Log.log_id) > sqlalchemy.tuple_(*after))
+    rows = query.order_by(Log.log_time.asc(), Log.log_id.asc()).limit(limit).all()
+
+    counts = {}
+    if with_counts and rows:
+        counts = {action_type: rows[0]._mapping[f"count_{action_type}"] for action_type in action_types}
+    return rows, counts
+
+def get_recent_action_counts(session, since: datetime) -> List[Tuple[date, int, int, int, int]]:
+    """Returns the number of logs per day, guild, target user and action type since `since`."""
+    day = func.date(Log.log_time, type_=sqlalchemy.Date)
+    return (
+        session.query(day, Log.guild_id, Log.target_user_id, Log.action_type, func.count())
+        .filter(Log.log_time >= since)
+        .filter(Log.target_user_id.isnot(None))
+        .group_by(day, Log.guild_id, Log.target_user_id, Log.action_type)
+        .all()
+    )
+
+def get_pending_deletions(session) -> List[Tuple[datetime, int, int]]:
+    return session.query(PendingDeletion.delete_at, PendingDeletion.channel_id, PendingDeletion.message_id).all()
+
+def update_pending_deletions(session, added: List[Tuple[datetime, int, int]], removed: List[int]):
+    if added:
+        session.execute(
+            sqlalchemy.insert(PendingDeletion),
+            [{"delete_at": delete_at, "channel_id": channel_id, "message_id": message_id} for delete_at, channel_id, message_id in added]
+        )
+    if removed:
+        session.execute(
+            delete(PendingDeletion).where(PendingDeletion.message_id.in_(removed)).execution_options(synchronize_session=False)
+        )
+    session.commit()
+
+def get_attachment_hashes(session) -> Set[str]:
+    return {
+        key for key, in session.query(Log.log_attachment_hash).filter(Log.log_attachment_hash.isnot(None)).distinct()
+    }
+
+def collect_attachment_garbage(referenced: Set[str], older_than: datetime) -> int:
+    """Delete stored attachments stored before `older_than` that no log references, returns the number deleted."""
+    removed = 0
+    for key in list(attachment_store.keys(older_than=older_than)):
+        if key not in referenced:
+            attachment_store.delete(key)
+            removed += 1
+    return removed
+
+def checkpoint_wal(session) -> Tuple[int, int, int]:
+    """Returns whether the checkpoint was blocked, the pages in the WAL and the pages checkpointed."""
+    return tuple(session.execute(text("PRAGMA wal_checkpoint(PASSIVE)")).one())
+
+def delete_old_logs(session, cutoff_date: datetime, chunk_size: int) -> int:
+    """Delete up to `chunk_size` logs older than `cutoff_date` in a single statement, returns the number deleted."""
+    expired = select(Log.log_id).where(Log.log_time < cutoff_date).limit(chunk_size)
+    result = session.execute(
+        delete(Log).where(Log.log_id.in_(expired)).execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return result.rowcount
+
+class LogWriteQueue:
+    """Write-behind queue that batches new `Log` rows into one transaction per flush.
+
+    A flush happens once `batch_size` logs are waiting or `flush_interval` seconds have passed,
+    whichever comes first, and once more when the bot shuts down.
+    """
+    def __init__(self, batch_size: int = 100, flush_interval: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: List[Log] = []
+        # Logs whose message ID arrived after they were handed to a flush
+        self._sent: List[Log] = []
+        self._flushing: Set[int] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.enqueued_total = 0
+        self.flushed_total = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def put(self, log: Log) -> None:
+        self._pending.append(log)
+        self.enqueued_total += 1
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def set_message_id(self, log: Log, message_id: int) -> None:
+        """Record the log message sent for `log`, updating the row if it has already been written."""
+        log.log_message_id = message_id
+        if log.log_id is None and id(log) not in self._flushing:
+            # Still waiting in the queue, the insert will pick it up
+            return
+        self._sent.append(log)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending and not self._sent:
+            return
+        batch, self._pending = self._pending, []
+        # Logs whose insert failed are back in the queue and already carry their message ID
+        sent = [log for log in self._sent if log.log_id is not None]
+        self._sent = []
+        self._flushing = {id(log) for log in batch}
+
+        start = time.perf_counter()
+        try:
+            await run_db(save_logs, batch, sent)
+        except Exception as e:
+            # Put the batch back in front of anything queued since, it will be retried on the next flush
+            self._pending[:0] = batch
+            self._sent[:0] = sent
+            self.flush_errors += 1
+            print(f"Error writing {len(batch)} logs to the database, will retry: {e}")
+            return
+        finally:
+            self._flushing = set()
+        elapsed = time.perf_counter() - start
+
+        self.flushed_total += len(batch)
+        self.flush_count += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "enqueued_total": self.enqueued_total,
+            "flushed_total": self.flushed_total,
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+        }
+
+log_queue = LogWriteQueue(
+    batch_size=config.get("db_write_batch_size", 100),
+    flush_interval=config.get("db_write_flush_interval_seconds", 1.0),
+)
+metrics.collect("modlog_log_queue", log_queue.stats)
+
+class ActionCounters:
+    """Rolling per-user action counts over the last `window`, keyed by `(guild_id, target_user_id)`.
+
+    Counts are updated as logs are written, so the embed footer counts are a dict lookup instead of an aggregate
+    query. They are also kept per day, and a day's counts are dropped once the whole day is older than the window.
+    A log can therefore be counted for up to a day longer than `window`. `rebuild()` reloads the per-day counts
+    from the database.
+    """
+    def __init__(self, window: timedelta = timedelta(days=30)):
+        self.window = window
+        self._counts: Dict[Tuple[int, int], Dict[int, int]] = {}
+        self._days: Dict[date, Dict[Tuple[int, int, int], int]] = {} # day: {(guild_id, target_user_id, action_type): count}
+
+    def _first_day(self) -> date:
+        return (datetime.now() - self.window).date()
+
+    def record(self, guild_id: int, target_user_id: Optional[int], action_type: int, log_time: datetime) -> None:
+        if target_user_id is None:
+            return
+        # Stored log times are naive, match them so the days line up with the database
+        self._add(log_time.replace(tzinfo=None).date(), guild_id, target_user_id, action_type, 1)
+
+    def _add(self, day: date, guild_id: int, target_user_id: int, action_type: int, count: int) -> None:
+        if day < self._first_day():
+            return
+        bucket = self._days.setdefault(day, {})
+        bucket[(guild_id, target_user_id, action_type)] = bucket.get((guild_id, target_user_id, action_type), 0) + count
+
+        counts = self._counts.setdefault((guild_id, target_user_id), {})
+        counts[action_type] = counts.get(action_type, 0) + count
+
+    def get(self, guild_id: int, target_user_id: int) -> Dict[int, int]:
+        self._expire()
+        return dict(self._counts.get((guild_id, target_user_id), {}))
+
+    def _expire(self) -> None:
+        first_day = self._first_day()
+        for day in [day for day in self._days if day < first_day]:
+            for (guild_id, target_user_id, action_type), count in self._days.pop(day).items():
+                key = (guild_id, target_user_id)
+                counts = self._counts[key]
+                counts[action_type] -= count
+                if counts[action_type] == 0:
+                    del counts[action_type]
+                    if not counts:
+                        del self._counts[key]
+
+    async def rebuild(self) -> None:
+        first_day = self._first_day()
+        rows = await run_db(get_recent_action_counts, datetime.combine(first_day, datetime.min.time()))
+        self._counts = {}
+        self._days = {}
+        for day, guild_id, target_user_id, action_type, count in rows:
+            # Rows are grouped by all four, and all from inside the window
+            self._days.setdefault(day, {})[(guild_id, target_user_id, action_type)] = count
+            counts = self._counts.setdefault((guild_id, target_user_id), {})
+            counts[action_type] = counts.get(action_type, 0) + count
+        total = sum(sum(counts.values()) for counts in self._counts.values())
+        print(f"Loaded {total} recent actions for {len(self._counts)} users.")
+
+action_counters = ActionCounters()
+
+def write_log(log: Log) -> None:
+    """Queue a log for writing and count it towards the target user's recent actions."""
+    action_counters.record(log.guild_id, log.target_user_id, log.action_type, log.log_time)
+    log_queue.put(log)
+
+class OutgoingLogMessage:
+    """A log channel message waiting in `LogChannelDispatcher`, with the logs its message ID belongs to."""
+    def __init__(
+            self,
+            content: str,
+            embed: Optional[discord.Embed],
+            file: Optional[discord.File],
+            logs: List[Log],
+    ):
+        self.content = content
+        self.embed = embed
+        self.file = file
+        self.logs = logs
+        self.enqueued_at = time.monotonic()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class LogChannelDispatcher:
+    """Sends log channel messages in order through one worker per channel, staying under the channel rate limit.
+
+    Each channel sends at most `rate` messages every `per` seconds. Messages queue up while the channel is
+    at the limit, and once a backlog builds the queued embeds are packed into as few messages as Discord allows.
+    The ID of each sent message is written back to the `Log.log_message_id` of every log it carries.
+    """
+    MAX_EMBEDS = 10
+    MAX_CONTENT_LENGTH = 2000
+    MAX_EMBEDS_LENGTH = 6000
+
+    def __init__(self, rate: int = 5, per: float = 5.0):
+        self.rate = rate
+        self.per = per
+        self._queues: Dict[int, deque] = {}
+        self._send_times: Dict[int, deque] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self.packed_messages = 0
+        self.send_errors = 0
+        self.last_latency_seconds = 0.0
+        self.max_latency_seconds = 0.0
+
+    @property
+    def backlog(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def send(
+            self,
+            channel: discord.abc.Messageable,
+            content: str = "",
+            embed: Optional[discord.Embed] = None,
+            file: Optional[discord.File] = None,
+            logs: Optional[List[Log]] = None,
+    ) -> asyncio.Future:
+        """Queue a message for `channel`, returns a future for the sent message, or None if sending failed."""
+        item = OutgoingLogMessage(content, embed, file, logs or [])
+        self._queues.setdefault(channel.id, deque()).append(item)
+        if channel.id not in self._workers:
+            self._workers[channel.id] = asyncio.create_task(self._run(channel))
+        return item.future
+
+    async def drain(self, timeout: float) -> None:
+        """Wait up to `timeout` seconds for the queued messages to be sent."""
+        if self._workers:
+            await asyncio.wait(list(self._workers.values()), timeout=timeout)
+
+    def _next_batch(self, queue: deque) -> List[OutgoingLogMessage]:
+        """Take the next message off `queue`, packing the embeds queued behind it into the same message."""
+        batch = [queue.popleft()]
+        if batch[0].file is not None or batch[0].embed is None:
+            return batch
+        content_length = len(batch[0].content)
+        embeds_length = len(batch[0].embed)
+        while queue and len(batch) < self.MAX_EMBEDS:
+            item = queue[0]
+            if item.file is not None or item.embed is None:
+                break
+            if item.content:
+                content_length += len(item.content) + 1
+            embeds_length += len(item.embed)
+            if content_length > self.MAX_CONTENT_LENGTH or embeds_length > self.MAX_EMBEDS_LENGTH:
+                break
+            batch.append(queue.popleft())
+        return batch
+
+    async def _wait_for_rate_limit(self, channel_id: int) -> None:
+        send_times = self._send_times.setdefault(channel_id, deque())
+        now = time.monotonic()
+        while send_times and send_times[0] <= now - self.per:
+            send_times.popleft()
+        if len(send_times) >= self.rate:
+            await asyncio.sleep(send_times[0] + self.per - now)
+            send_times.popleft()
+        send_times.append(time.monotonic())
+
+    async def _run(self, channel: discord.abc.Messageable) -> None:
+        queue = self._queues[channel.id]
+        try:
+            while queue:
+                await self._wait_for_rate_limit(channel.id)
+                # Anything queued while waiting goes out with this message
+                batch = self._next_batch(queue)
+                await self._send(channel, batch)
+        finally:
+            del self._workers[channel.id]
+            if not queue:
+                del self._queues[channel.id]
+
+    async def _send(self, channel: discord.abc.Messageable, batch: List[OutgoingLogMessage]) -> None:
+        # Packed messages often ask the same moderator for context, only ask once
+        content = "\n".join(dict.fromkeys(item.content for item in batch if item.content))
+        embeds = [item.embed for item in batch if item.embed is not None]
+        try:
+            message = await channel.send(content, embeds=embeds, file=batch[0].file)
+        except Exception as e:
+            self.send_errors += 1
+            print(f"Error sending {len(batch)} log messages to channel {channel.id}: {e}")
+            message = None
+
+        now = time.monotonic()
+        for item in batch:
+            if message is not None:
+                for log in item.logs:
+                    log_queue.set_message_id(log, message.id)
+            if not item.future.done():
+                item.future.set_result(message)
+            latency = now - item.enqueued_at
+            self.last_latency_seconds = latency
+            self.max_latency_seconds = max(self.max_latency_seconds, latency)
+
+        if message is not None:
+            self.sent_messages += 1
+            self.sent_embeds += len(embeds)
+            if len(batch) > 1:
+                self.packed_messages += 1
+
+    def stats(self) -> dict:
+        return {
+            "backlog": self.backlog,
+            "sent_messages": self.sent_messages,
+            "sent_embeds": self.sent_embeds,
+            "packed_messages": self.packed_messages,
+            "send_errors": self.send_errors,
+            "last_latency_seconds": self.last_latency_seconds,
+            "max_latency_seconds": self.max_latency_seconds,
+        }
+
+log_dispatcher = LogChannelDispatcher(
+    rate=config.get("log_channel_send_rate", 5),
+    per=config.get("log_channel_send_period_seconds", 5.0),
+)
+metrics.collect("modlog_log_dispatcher", log_dispatcher.stats)
+
+@tasks.loop(minutes=config.get("db_retention_interval_minutes", 60))
+async def retention_worker():
+    """Delete logs older than `db_log_retention_days` in chunks, yielding to the event loop between chunks."""
     # Calculate the cutoff date (3 months ago by default)
     cutoff_date = datetime.now() - timedelta(days=config.get("db_log_retention_days", 90))
+    chunk_size = config.get("db_retention_chunk_size", 1000)
 
-    # Query and delete logs older than the cutoff date
-    old_logs = session.query(Log).filter(Log.log_time < cutoff_date).all()
-    for log in old_logs:
-        session.delete(log)
+    removed = 0
+    try:
+        while True:
+            deleted = await run_db(delete_old_logs, cutoff_date, chunk_size)
+            removed += deleted
+            if deleted < chunk_size:
+                break
+    except Exception as e:
+        print(f"Error while deleting old logs after removing {removed}: {e}")
+        return
+    print(f"Retention removed {removed} logs older than {cutoff_date.strftime('%Y-%m-%d %H:%M:%S')}.")
 
-    # Commit the changes to the database
-    session.commit()
+    try:
+        referenced = await run_db(get_attachment_hashes)
+        # Skip recent files, their logs may still be waiting in the write queue
+        removed_attachments = await asyncio.to_thread(collect_attachment_garbage, referenced, datetime.now() - timedelta(hours=1))
+    except Exception as e:
+        print(f"Error while deleting unreferenced attachments: {e}")
+        return
+    if removed_attachments:
+        print(f"Retention removed {removed_attachments} unreferenced attachments.")
+
+class UserResolver:
+    """Resolves user IDs to users without hitting the REST API more than needed.
+
+    Lookups check the gateway cache first, then a bounded TTL/LRU cache that also remembers users that don't exist,
+    and only then call `bot.fetch_user`. Concurrent lookups of the same ID share a single REST call.
+    """
+    def __init__(self, max_size: int = 1000, ttl: float = 1800, negative_ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._cache: OrderedDict[int, Tuple[float, Optional[discord.User]]] = OrderedDict() # user_id: (expires, user)
+        self._inflight: Dict[int, asyncio.Task] = {}
+
+        self.gateway_hits = 0
+        self.cache_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.rest_calls = 0
+
+    async def resolve(self, user_id: int) -> Optional[discord.User]:
+        """Returns the user, or None if Discord doesn't know the user."""
+        user = bot.get_user(user_id)
+        if user is not None:
+            self.gateway_hits += 1
+            return user
+
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            self._cache.move_to_end(user_id)
+            if cached[1] is None:
+                self.negative_hits += 1
+            else:
+                self.cache_hits += 1
+            return cached[1]
+
+        self.misses += 1
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        else:
+            self.coalesced += 1
+        # Shield the shared lookup so one cancelled caller doesn't cancel it for the others
+        with profile_phase("user_resolution"):
+            return await asyncio.shield(task)
 
-async def check_db_size():
-    """Check the size of the database and delete old logs if it exceeds 100MB."""
-    db_size = os.path.getsize(f"{config_folder_path}mod_logs.db") / (1024 * 1024)  # Size in MB
-    warning_threshold = config.get("db_size_warning_threshold", 100)
-    if db_size > warning_threshold:
-        if bot.owner_id is None:
-            await bot.is_owner(bot.user) # Ensure bot.owner_id/bot.owner_ids is set
-
-        bot_owners = bot.owner_ids if isinstance(bot.owner_ids, set) else [bot.owner_id]
-        for owner_id in bot_owners:
-            owner_user = await bot.fetch_user(owner_id)
+    async def _fetch(self, user_id: int) -> Optional[discord.User]:
+        self.rest_calls += 1
+        try:
+            user = await bot.fetch_user(user_id)
+            expires = time.monotonic() + self.ttl
+        except discord.NotFound:
+            user = None
+            expires = time.monotonic() + self.negative_ttl
+
+        self._cache[user_id] = (expires, user)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return user
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._cache),
+            "gateway_hits": self.gateway_hits,
+            "cache_hits": self.cache_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "rest_calls": self.rest_calls,
+        }
+
+user_resolver = UserResolver(
+    max_size=config.get("user_cache_size", 1000),
+    ttl=config.get("user_cache_ttl_minutes", 30) * 60,
+    negative_ttl=config.get("user_cache_negative_ttl_minutes", 5) * 60,
+)
+metrics.collect("modlog_user_resolver", user_resolver.stats)
+
+def get_db_size(session) -> tuple[int, int]:
+    """Returns the bytes used by live pages and the bytes held by free pages in the database."""
+    if session.bind.dialect.name == "postgresql":
+        return session.execute(text("SELECT pg_database_size(current_database())")).scalar(), 0
+    page_size = session.execute(text("PRAGMA page_size")).scalar()
+    page_count = session.execute(text("PRAGMA page_count")).scalar()
+    freelist_count = session.execute(text("PRAGMA freelist_count")).scalar()
+    return (page_count - freelist_count) * page_size, freelist_count * page_size
+
+class DbSizeMonitor:
+    """Warns the bot owners when the database grows past `db_size_warning_threshold`.
+
+    Once a warning is sent, it is repeated at most every `db_size_warning_cooldown_hours` while the database stays
+    over the threshold, and is only re-armed after the size drops `db_size_warning_hysteresis` below the threshold.
+    """
+    def __init__(self):
+        self._owners: List[discord.User] = []
+        self._alerting = False
+        self._last_alert: Optional[datetime] = None
+
+    async def get_owners(self) -> List[discord.User]:
+        if not self._owners:
+            if bot.owner_id is None and not bot.owner_ids:
+                await bot.is_owner(bot.user) # Ensure bot.owner_id/bot.owner_ids is set
+
+            bot_owners = bot.owner_ids if bot.owner_ids else [bot.owner_id]
+            for owner_id in bot_owners:
+                owner_user = await user_resolver.resolve(owner_id)
+                if owner_user is not None:
+                    self._owners.append(owner_user)
+        return self._owners
+
+    async def check(self) -> None:
+        used_bytes, free_bytes = await run_db(get_db_size)
+        db_size = used_bytes / (1024 * 1024)  # Size in MB
+        warning_threshold = config.get("db_size_warning_threshold", 100)
+        rearm_threshold = warning_threshold * (1 - config.get("db_size_warning_hysteresis", 0.1))
+
+        if db_size <= rearm_threshold:
+            self._alerting = False
+            return
+        if db_size <= warning_threshold:
+            return
+
+        cooldown = timedelta(hours=config.get("db_size_warning_cooldown_hours", 24))
+        if self._alerting and self._last_alert and datetime.now() - self._last_alert < cooldown:
+            return
+
+        self._alerting = True
+        self._last_alert = datetime.now()
+        for owner_user in await self.get_owners():
             await owner_user.send(
                 f"Database size of {db_size:.2f}MB exceeds warning threshold of {warning_threshold}MB"
+                f" ({free_bytes / (1024 * 1024):.2f}MB of free pages can be reclaimed with VACUUM)"
             )
 
+db_size_monitor = DbSizeMonitor()
+
+@tasks.loop(minutes=config.get("db_wal_checkpoint_interval_minutes", 5))
+async def wal_checkpoint_worker():
+    """Keep the write-ahead log from growing between SQLite's automatic checkpoints."""
+    if not is_sqlite or str(get_sqlite_pragmas().get("journal_mode", "")).upper() != "WAL":
+        return
+    try:
+        busy, wal_pages, checkpointed_pages = await run_db(checkpoint_wal)
+    except Exception as e:
+        print(f"Error while checkpointing the write-ahead log: {e}")
+        return
+    if busy:
+        print(f"WAL checkpoint was blocked, {checkpointed_pages}/{wal_pages} pages checkpointed.")
+
+@tasks.loop(hours=config.get("db_backup_interval_hours") or 24)
+async def backup_worker():
+    # The loop's first run is at startup, right after the pre-upgrade backup if there was one
+    if db_backup is None or not config.get("db_backup_interval_hours", 24) or backup_worker.current_loop == 0:
+        return
+    try:
+        # A thread of its own, the database thread keeps writing logs while the pages are copied
+        await asyncio.to_thread(db_backup.backup, "scheduled")
+    except Exception as e:
+        print(f"Error while backing up the database: {e}")
+
+@tasks.loop(minutes=config.get("db_size_check_interval_minutes", 30))
+async def db_size_worker():
+    try:
+        await db_size_monitor.check()
+    except Exception as e:
+        print(f"Error while checking database size: {e}")
+
+@db_size_worker.before_loop
+async def before_db_size_worker():
+    await bot.wait_until_ready()
+
 def get_server(server_id: int):
     try:
         return SERVERS[server_id]
@@ -285,44 +1609,472 @@ def get_ignored_channels(server_id: int):
     except TypeError:
         return []
 
-def get_auto_message_removals(server_id: int) -> List[Config_AutoMessageRemoval]:
+def get_message_delete_coalesce_seconds(server_id: int) -> float:
+    try:
+        return get_server(server_id)['message_delete_coalesce_seconds']
+    except KeyError:
+        # No debug log if not found
+        return 0
+    except TypeError:
+        return 0
+
+def get_auto_message_removals(server_id: int) -> Dict[int, List[AutoMessageRemovalRule]]:
+    """Returns the server's auto message removal rules keyed by channel ID."""
     try:
         return get_server(server_id)['auto_message_removals']
     except KeyError:
         # No debug log if not found
-        return []
+        return {}
     except TypeError:
-        return []
+        return {}
+
+async def delete_messages(channel: discord.abc.Messageable, messages: List[discord.abc.Snowflake]) -> None:
+    """Deletes up to 100 messages in one request, ignoring messages that are already gone."""
+    try:
+        await channel.delete_messages(messages)
+    except discord.NotFound:
+        # Only raised for single message deletes, the message is already gone
+        pass
+
+async def delete_message(message: Union[discord.Message, discord.PartialMessage]) -> None:
+    """Deletes a single message, ignoring it if it is already gone."""
+    try:
+        await message.delete()
+    except discord.NotFound:
+        pass
+
+class MessageDeletionScheduler:
+    """Deletes messages after a delay from a single task instead of one sleeping task per message.
+
+    Due messages are grouped per channel and removed with bulk deletes of up to 100 messages. Messages too old for
+    bulk deletion fall back to single deletes. Pending deletions are persisted so they survive a restart, deletions that
+    fail stay saved and are retried on the next start.
+    """
+    BULK_DELETE_MAX = 100
+    # Discord refuses to bulk delete messages older than 14 days, leave some margin for clock skew
+    BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+    # Seconds before saving newly scheduled deletions is retried after it failed
+    PERSIST_INTERVAL = 5.0
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, int]] = [] # (delete_at, channel_id, message_id)
+        self._added: List[Tuple[datetime, int, int]] = []
+        self._removed: List[int] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, message: discord.Message, delay: Optional[float] = None) -> None:
+        item = (datetime.now() + timedelta(seconds=delay or 0), message.channel.id, message.id)
+        heapq.heappush(self._heap, item)
+        # Save it right away instead of when the next deletion is due, the ones scheduled meanwhile join that write
+        unsaved = bool(self._added)
+        self._added.append(item)
+        if self._heap[0] is item or not unsaved:
+            self._wakeup.set()
+
+    async def load(self) -> None:
+        self._heap = [tuple(row) for row in await run_db(get_pending_deletions)]
+        heapq.heapify(self._heap)
+        if self._heap:
+            print(f"Loaded {len(self._heap)} pending message deletions.")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._persist()
+
+    async def _persist(self) -> None:
+        if not self._added and not self._removed:
+            return
+        added, self._added = self._added, []
+        removed, self._removed = self._removed, []
+        try:
+            await run_db(update_pending_deletions, added, removed)
+        except Exception as e:
+            self._added[:0] = added
+            self._removed[:0] = removed
+            print(f"Error saving pending message deletions: {e}")
+
+    async def _run(self) -> None:
+        await bot.wait_until_ready()
+        while True:
+            await self._persist()
+
+            timeout = None
+            if self._heap:
+                timeout = max((self._heap[0][0] - datetime.now()).total_seconds(), 0)
+            if self._added:
+                timeout = min(timeout, self.PERSIST_INTERVAL) if timeout is not None else self.PERSIST_INTERVAL
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            due: Dict[int, List[int]] = {}
+            now = datetime.now()
+            while self._heap and self._heap[0][0] <= now:
+                _, channel_id, message_id = heapq.heappop(self._heap)
+                due.setdefault(channel_id, []).append(message_id)
+
+            for channel_id, message_ids in due.items():
+                try:
+                    self._removed.extend(await self._delete(channel_id, message_ids))
+                except Exception as e:
+                    print(f"Error deleting {len(message_ids)} messages in channel {channel_id}: {e}")
+
+    async def _delete(self, channel_id: int, message_ids: List[int]) -> List[int]:
+        """Returns the IDs of the messages that are gone now, failed deletions are left out."""
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            print(f"Channel {channel_id} not found. Skipping deletion of {len(message_ids)} messages.")
+            return message_ids
+
+        bulk_cutoff = discord.utils.utcnow() - self.BULK_DELETE_MAX_AGE
+        recent = [message_id for message_id in message_ids if discord.utils.snowflake_time(message_id) > bulk_cutoff]
+        old = [message_id for message_id in message_ids if discord.utils.snowflake_time(message_id) <= bulk_cutoff]
+
+        deleted = []
+        for i in range(0, len(recent), self.BULK_DELETE_MAX):
+            chunk = recent[i:i + self.BULK_DELETE_MAX]
+            try:
+                await delete_messages(channel, [discord.Object(id=message_id) for message_id in chunk])
+                deleted.extend(chunk)
+            except discord.HTTPException:
+                # Bulk deletes fail as a whole, retry them one by one so one bad message doesn't keep the rest
+                old.extend(chunk)
+
+        for message_id in old:
+            try:
+                await delete_message(channel.get_partial_message(message_id))
+                deleted.append(message_id)
+            except discord.HTTPException as e:
+                print(f"Error deleting message {message_id} in channel {channel_id}: {e}")
+        return deleted
+
+deletion_scheduler = MessageDeletionScheduler()
 
 async def handle_auto_message_removal(message: discord.Message) -> None:
-    auto_message_removals = get_auto_message_removals(message.guild.id)
-    
-    for auto_message_removal in auto_message_removals:
-        if message.channel.id == auto_message_removal.channel_id:
-            # Test if message should be removed
-            if auto_message_removal.regex_matching is not None and re.match(auto_message_removal.regex_matching, message.content) is None:
-                return # setting is set and NOT matched, so we ignore this message
-            if auto_message_removal.regex_not_matching is not None and re.match(auto_message_removal.regex_not_matching, message.content) is not None:
-                return # setting is set and matched, so we ignore this message
-
-            # Remove message
-            if auto_message_removal.response_message:
-                # Send a response that deletes itself after the configured time
-                msg = await message.reply(auto_message_removal.response_message, mention_author=True)
-                await msg.delete(delay=auto_message_removal.removal_delay_seconds)
-
-            # Delete the user's original message after the configured time
-            await message.delete(delay=auto_message_removal.removal_delay_seconds)
+    rules = get_auto_message_removals(message.guild.id).get(message.channel.id)
+    if not rules:
+        return
+
+    for rule in rules:
+        # Test if message should be removed
+        if not rule.should_remove(message.content):
+            continue
+        auto_message_removal = rule.config
+
+        # Remove message
+        if auto_message_removal.response_message:
+            # Send a response that deletes itself after the configured time
+            msg = await message.reply(auto_message_removal.response_message, mention_author=True)
+            deletion_scheduler.schedule(msg, auto_message_removal.removal_delay_seconds)
+
+        # Delete the user's original message after the configured time
+        deletion_scheduler.schedule(message, auto_message_removal.removal_delay_seconds)
+
+        # The message is gone, so later rules for this channel have nothing left to act on
+        return
 
 @bot.event
 async def on_ready():
     print(f"Build date: {BUILD_DATE}")
     print(f"Version: {VERSION}")
     print(f"Logged in as {bot.user}!")
-    await check_db_size()
+
+class AuditLogEvent:
+    """An audit log entry classified by its handler: the action type, how to render it and the data to log."""
+    def __init__(
+            self,
+            action_type: int,
+            title: str,
+            colour: discord.Colour,
+            description: Optional[List[str]] = None,
+            log_data: Optional[dict] = None,
+            render: Optional[Callable[["AuditLogEvent", discord.AuditLogEntry], Awaitable[None]]] = None,
+    ):
+        self.action_type = action_type
+        self.title = title
+        self.colour = colour
+        self.description = description or []
+        self.log_data = log_data or {}
+        # Optional coroutine for details that need network I/O, only awaited once the entry is known to be logged
+        self.render = render
+
+AuditLogHandler = Callable[[discord.AuditLogEntry], Optional[AuditLogEvent]]
+AUDIT_LOG_HANDLERS: Dict[discord.AuditLogAction, AuditLogHandler] = {}
+
+def audit_log_handler(action: discord.AuditLogAction):
+    """Register the handler for an audit log action.
+
+    Handlers must not do any network I/O, they return None for entries that should not be logged.
+    """
+    def decorator(func: AuditLogHandler) -> AuditLogHandler:
+        AUDIT_LOG_HANDLERS[action] = func
+        return func
+    return decorator
+
+@audit_log_handler(discord.AuditLogAction.ban)
+def handle_ban(entry: discord.AuditLogEntry) -> Optional[AuditLogEvent]:
+    return AuditLogEvent(
+        ActionType.BAN, "🚨 Banned", discord.Colour.red(),
+        description=[f"**Reason:** {entry.reason or 'No reason provided.'}"],
+        log_data={"reason": entry.reason},
+    )
+
+@audit_log_handler(discord.AuditLogAction.unban)
+def handle_unban(entry: discord.AuditLogEntry) -> Optional[AuditLogEvent]:
+    return AuditLogEvent(ActionType.UNBAN, "✅ Unbanned", discord.Colour.red())
+
+@audit_log_handler(discord.AuditLogAction.kick)
+def handle_kick(entry: discord.AuditLogEntry) -> Optional[AuditLogEvent]:
+    return AuditLogEvent(
+        ActionType.KICK, "🥾 Kicked", discord.Colour.red(),
+        description=[f"**Reason:** {entry.reason or 'No reason provided.'}"],
+        log_data={"reason": entry.reason},
+    )
+
+async def render_nickname_change(event: AuditLogEvent, entry: discord.AuditLogEntry) -> None:
+    user = await user_resolver.resolve(entry.target.id)
+    display_name = user.display_name if user else str(entry.target.id)
+
+    event.description.append(f"**Before:** {entry.before.nick or display_name}")
+    event.description.append(f"**After:** {entry.after.nick or display_name}")
+
+    event.log_data["old_nick"] = entry.before.nick or display_name
+    event.log_data["new_nick"] = entry.after.nick or display_name
+
+@audit_log_handler(discord.AuditLogAction.member_update)
+def handle_member_update(entry: discord.AuditLogEntry) -> Optional[AuditLogEvent]:
+    event = None
+
+    if "timed_out_until" in entry.before.__dict__ and entry.before.timed_out_until != entry.after.timed_out_until:
+        if entry.after.timed_out_until:
+            timeout_duration = entry.after.timed_out_until - entry.created_at
+            timeout_duration += timedelta(seconds=1)
+            event = AuditLogEvent(
+                ActionType.TIMEOUT, "⏳ Timedout", discord.Colour.orange(),
+                description=[
+                    f"**Reason:** {entry.reason or 'No reason provided.'}",
+                    f"**Timed Out For:** {str(timeout_duration).split('.')[0]}",
+                ],
+                log_data={
+                    "reason": entry.reason,
+                    "timeout_end_time": entry.after.timed_out_until.isoformat(),
+                },
+            )
+        else:
+            event = AuditLogEvent(ActionType.TIMEOUT_REMOVED, "⏳ Timeout Removed", discord.Colour.orange())
+
+    # Later changes in the same entry take over the title and action type, but keep the details gathered so far
+    if event is None:
+        event = AuditLogEvent(ActionType.UNKNOWN, f"Unknown Action: {entry.action}", discord.Colour.default())
+
+    if "mute" in entry.before.__dict__ and entry.before.mute != entry.after.mute:
+        mute_status = "Muted" if entry.after.mute else "Unmuted"
+        event.title = f"🔇 {mute_status}"
+        event.colour = discord.Colour.purple()
+        event.action_type = ActionType.MUTED if entry.after.mute else ActionType.UNMUTED
+
+    if "nick" in entry.before.__dict__ and entry.before.nick != entry.after.nick and entry.target.id != entry.user.id:
+        event.title = f"📝 Nickname Changed"
+        event.colour = discord.Colour.purple()
+        event.action_type = ActionType.NICKNAME_CHANGED
+        event.render = render_nickname_change
+
+    if event.action_type == ActionType.UNKNOWN:
+        return None
+    return event
+
+@audit_log_handler(discord.AuditLogAction.member_disconnect)
+def handle_member_disconnect(entry: discord.AuditLogEntry) -> Optional[AuditLogEvent]:
+    return AuditLogEvent(ActionType.MEMBER_DISCONNECT, "🔊 Disconnected From Voice", discord.Colour.purple())
+
+@audit_log_handler(discord.AuditLogAction.message_delete)
+def handle_message_delete(entry: discord.AuditLogEntry) -> Optional[AuditLogEvent]:
+    guild = entry.guild
+    if entry.extra.channel.id in get_ignored_channels(guild.id):
+        print(f"Message delete action ignored for channel `{entry.extra.channel.name} ({entry.extra.channel.id})` in guild `{guild.name} ({guild.id})`.")
+        return None
+    return AuditLogEvent(
+        ActionType.MESSAGE_DELETE, "🗑️ Message Deleted", discord.Colour.magenta(),
+        description=[f"**Channel:** <#{entry.extra.channel.id}>"],
+        log_data={"channel_id": entry.extra.channel.id},
+    )
+
+class MessageDeleteBurst:
+    """Message delete audit log entries by one moderator for one target in one channel, logged together."""
+    def __init__(self, entry: discord.AuditLogEntry, event: AuditLogEvent):
+        self.entry = entry
+        self.event = event
+        self.entries = 1
+        self.messages = self.message_count(entry)
+        self.task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def message_count(entry: discord.AuditLogEntry) -> int:
+        # One entry can stand for several deleted messages
+        return getattr(entry.extra, "count", None) or 1
+
+class MessageDeleteCoalescer:
+    """Merges bursts of message delete audit log entries into a single log.
+
+    The first entry of a burst waits for the guild's `message_delete_coalesce_seconds`, entries for the same
+    moderator, target and channel arriving in that window are added to it. A burst of one entry is logged as a
+    normal message delete, larger bursts as one bulk message delete with the number of messages their entries stand for.
+    """
+    def __init__(self):
+        self._bursts: Dict[Tuple[int, int, int, int], MessageDeleteBurst] = {}
+        self.coalesced_total = 0
+        self.bursts_total = 0
+
+    def add(self, entry: discord.AuditLogEntry, event: AuditLogEvent, window: float) -> None:
+        key = (entry.guild.id, entry.user.id, entry.target.id, entry.extra.channel.id)
+        burst = self._bursts.get(key)
+        if burst is not None:
+            burst.entries += 1
+            burst.messages += MessageDeleteBurst.message_count(entry)
+            self.coalesced_total += 1
+            return
+        burst = self._bursts[key] = MessageDeleteBurst(entry, event)
+        burst.task = asyncio.create_task(self._close_after(key, burst, window))
+
+    async def _close_after(self, key: Tuple[int, int, int, int], burst: MessageDeleteBurst, window: float) -> None:
+        await asyncio.sleep(window)
+        if self._bursts.get(key) is burst:
+            del self._bursts[key]
+            await self._log(burst)
+
+    async def flush(self) -> None:
+        """Log every open burst now instead of waiting for its window to close."""
+        bursts, self._bursts = list(self._bursts.values()), {}
+        for burst in bursts:
+            burst.task.cancel()
+            await self._log(burst)
+
+    async def _log(self, burst: MessageDeleteBurst) -> None:
+        self.bursts_total += 1
+        event = burst.event
+        if burst.entries > 1:
+            event.action_type = ActionType.BULK_MESSAGE_DELETE
+            event.title = "🗑️ Bulk Message Delete"
+            event.description.append(f"**Messages:** {burst.messages}")
+            event.log_data["message_count"] = burst.messages
+        try:
+            await log_audit_event(burst.entry, event)
+        except Exception as e:
+            print(f"Error while logging {burst.messages} message deletes: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "open_bursts": len(self._bursts),
+            "bursts_total": self.bursts_total,
+            "coalesced_total": self.coalesced_total,
+        }
+
+message_delete_coalescer = MessageDeleteCoalescer()
+metrics.collect("modlog_message_delete_coalescer", message_delete_coalescer.stats)
+
+class EventTraceRecorder:
+    """Appends the audit log entries and guild messages from users the bot receives to a JSONL trace.
+
+    Only the fields the handlers read are recorded, so `benchmarks/replay.py` can feed the trace back into them.
+    Message contents are left out unless `include_content` is set.
+    """
+    TRACED_CHANGES = ("timed_out_until", "mute", "nick")
+
+    def __init__(self, path: Optional[str], include_content: bool = False):
+        self.path = path
+        self.include_content = include_content
+        self.recorded = 0
+        self._file = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _write(self, record: dict) -> None:
+        if self._file is None:
+            self._file = open(self.path, mode="a", encoding="utf-8")
+        self._file.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+        self.recorded += 1
+
+    def audit_log_entry(self, entry: discord.AuditLogEntry) -> None:
+        record = {
+            "t": round(time.time(), 3),
+            "type": "audit",
+            "guild": entry.guild.id,
+            "action": entry.action.value,
+            "user": entry.user.id if entry.user else None,
+            "target": getattr(entry.target, "id", None),
+            "reason": entry.reason,
+        }
+        channel = getattr(entry.extra, "channel", None)
+        if channel is not None:
+            record["channel"] = channel.id
+            record["count"] = getattr(entry.extra, "count", 1)
+        changes = {
+            name: [getattr(entry.before, name), getattr(entry.after, name)]
+            for name in self.TRACED_CHANGES if name in entry.before.__dict__
+        }
+        if changes:
+            record["changes"] = changes
+        self._write(record)
+
+    def message(self, message: discord.Message) -> None:
+        self._write({
+            "t": round(time.time(), 3),
+            "type": "message",
+            "guild": message.guild.id,
+            "channel": message.channel.id,
+            "author": message.author.id,
+            "content": message.content if self.include_content else "",
+        })
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+event_trace = EventTraceRecorder(config.get("event_trace_path"), config.get("event_trace_message_content", False))
 
 @bot.event
+@instrumented("on_audit_log_entry_create")
 async def on_audit_log_entry_create(entry):
+    # Classify the entry before doing any I/O, most audit log actions are not logged at all
+    handler = AUDIT_LOG_HANDLERS.get(entry.action)
+    if handler is None:
+        return
+    if event_trace.enabled:
+        event_trace.audit_log_entry(entry)
+    event = handler(entry)
+    if event is None:
+        return
+
+    if event.action_type == ActionType.MESSAGE_DELETE:
+        window = get_message_delete_coalesce_seconds(entry.guild.id)
+        if window > 0:
+            message_delete_coalescer.add(entry, event, window)
+            return
+
+    await log_audit_event(entry, event)
+
+async def log_audit_event(entry: discord.AuditLogEntry, event: AuditLogEvent) -> None:
+    """Send the log message for a classified audit log entry and save its log."""
     guild = entry.guild
     log_channel = guild.get_channel(get_log_channel_id(guild.id))
 
@@ -336,11 +2088,10 @@ async def on_audit_log_entry_create(entry):
             able_to_send = False
             print(f"Bot does not have permission to send messages and embed links in log channel '{log_channel.name}' ({log_channel.id}). Skipping log message.")
 
-    action_type = ActionType.UNKNOWN
-
     embed = discord.Embed(
         timestamp=entry.created_at,
-        title=f"Unknown Action: {entry.action}",
+        title=event.title,
+        colour=event.colour,
         description=""
     )
 
@@ -349,144 +2100,62 @@ async def on_audit_log_entry_create(entry):
     elif isinstance(entry.target, discord.User):
         embed.description += f"**User:** {entry.target.display_name} (<@{entry.target.id}>)"
     elif hasattr(entry, 'target') and hasattr(entry.target, 'id'):
-        try:
-            entry.target = await bot.fetch_user(entry.target.id)
-            if entry.target:
-                embed.description += f"**User:** {entry.target.display_name} (<@{entry.target.id}>)"
-            else:
-                embed.description += f"**User:** <@{entry.target.id}>"
-        except discord.NotFound:
+        target_user = await user_resolver.resolve(entry.target.id)
+        if target_user:
+            entry.target = target_user
+            embed.description += f"**User:** {entry.target.display_name} (<@{entry.target.id}>)"
+        else:
             embed.description += f"**User:** <@{entry.target.id}> (User not found)"
     embed.description += f"\n**Moderator:** {entry.user.nick or entry.user.display_name} (<@{entry.user.id}>)"
 
-    log_data = {}
-
-    if entry.action == discord.AuditLogAction.ban:
-        embed.title="🚨 Banned"
-        embed.colour=discord.Colour.red()
-        embed.description += f"\n**Reason:** {entry.reason or 'No reason provided.'}"
-        action_type = ActionType.BAN
-        log_data["reason"] = entry.reason
-
-    elif entry.action == discord.AuditLogAction.unban:
-        embed.title="✅ Unbanned"
-        embed.colour=discord.Colour.red()
-        action_type = ActionType.UNBAN
-
-    elif entry.action == discord.AuditLogAction.kick:
-        embed.title="🥾 Kicked"
-        embed.colour=discord.Colour.red()
-        embed.description += f"\n**Reason:** {entry.reason or 'No reason provided.'}"
-        action_type = ActionType.KICK
-        log_data["reason"] = entry.reason
-
-    elif entry.action == discord.AuditLogAction.member_update:
-        if "timed_out_until" in entry.before.__dict__ and entry.before.timed_out_until != entry.after.timed_out_until:
-            if entry.after.timed_out_until:
-                timeout_duration = entry.after.timed_out_until - entry.created_at
-                timeout_duration += timedelta(seconds=1)
-                embed.title="⏳ Timedout"
-                embed.colour=discord.Colour.orange()
-                embed.description += f"\n**Reason:** {entry.reason or 'No reason provided.'}"
-                embed.description += f"\n**Timed Out For:** {str(timeout_duration).split('.')[0]}"
-                action_type = ActionType.TIMEOUT
-                log_data["reason"] = entry.reason
-                log_data["timeout_end_time"] = entry.after.timed_out_until.isoformat()
-            else:
-                embed.title="⏳ Timeout Removed"
-                embed.colour=discord.Colour.orange()
-                action_type = ActionType.TIMEOUT_REMOVED
-
-        if "mute" in entry.before.__dict__ and entry.before.mute != entry.after.mute:
-            mute_status = "Muted" if entry.after.mute else "Unmuted"
-            embed.title=f"🔇 {mute_status}"
-            embed.colour=discord.Colour.purple()
-            action_type = ActionType.MUTED if entry.after.mute else ActionType.UNMUTED
-
-        if "nick" in entry.before.__dict__ and entry.before.nick != entry.after.nick and entry.target.id != entry.user.id:
-            embed.title=f"📝 Nickname Changed"
-            embed.colour=discord.Colour.purple()
-
-            user = await bot.fetch_user(entry.target.id)
-
-            embed.description += f"\n**Before:** {entry.before.nick or user.display_name}"
-            embed.description += f"\n**After:** {entry.after.nick or user.display_name}"
-
-            action_type = ActionType.NICKNAME_CHANGED
-
-            log_data["old_nick"] = entry.before.nick or user.display_name
-            log_data["new_nick"] = entry.after.nick or user.display_name
-
-    elif entry.action == discord.AuditLogAction.member_disconnect:
-        embed.title="🔊 Disconnected From Voice"
-        embed.colour=discord.Colour.purple()
-        action_type = ActionType.MEMBER_DISCONNECT
-
-    elif entry.action == discord.AuditLogAction.message_delete:
-        if entry.extra.channel.id in get_ignored_channels(guild.id):
-            print(f"Message delete action ignored for channel `{entry.extra.channel.name} ({entry.extra.channel.id})` in guild `{guild.name} ({guild.id})`.")
-            return
-        embed.title = "🗑️ Message Deleted"
-        embed.colour = discord.Colour.magenta()
-        embed.description += f"\n**Channel:** <#{entry.extra.channel.id}>"
-        action_type = ActionType.MESSAGE_DELETE
-        log_data["channel_id"] = entry.extra.channel.id
-
-    if action_type == ActionType.UNKNOWN:
-        return
-
-    if isinstance(entry.target, discord.Member) or isinstance(entry.target, discord.User):
-        results = (
-            session.query(Log.action_type, func.count(Log.action_type))
-            .filter(Log.guild_id == guild.id)
-            .filter(Log.target_user_id == entry.target.id)
-            .filter(Log.log_time >= datetime.now() - timedelta(days=30))
-            .group_by(Log.action_type)
-            .all()
-        )
-        actions = {action_type: count for action_type, count in results}
-        warnings = actions.get(ActionType.WARNING, 0)
-        deleted_messages = (
-            actions.get(ActionType.MESSAGE_DELETE, 0)
-            + actions.get(ActionType.BULK_MESSAGE_DELETE, 0)
-            + (1 if action_type == ActionType.MESSAGE_DELETE else 0)
-        )
-        timeouts = actions.get(ActionType.TIMEOUT, 0) + (1 if action_type == ActionType.TIMEOUT else 0)
-        kicks = actions.get(ActionType.KICK, 0) + (1 if action_type == ActionType.KICK else 0)
-        bans = actions.get(ActionType.BAN, 0) + (1 if action_type == ActionType.BAN else 0)
-        embed.set_footer(text=f"Warnings: {warnings} | Deleted Messages: {deleted_messages} | Timeouts: {timeouts} | Kicks: {kicks} | Bans: {bans}")
-
-    message = None
-    if able_to_send:
-        comment = ""
-        if (
-                (action_type in need_reason and entry.reason is None) or
-                (not (isinstance(entry.target, discord.Member) or isinstance(entry.target, discord.User)))
-        ):
-            comment = f"Hey <@{entry.user.id}>, can you add some context to this action?"
-        message = await log_channel.send(comment, embed=embed)
+    with profile_phase("render"):
+        if event.render is not None:
+            await event.render(event, entry)
+        for line in event.description:
+            embed.description += f"\n{line}"
+
+        action_type = event.action_type
+        if isinstance(entry.target, discord.Member) or isinstance(entry.target, discord.User):
+            actions = action_counters.get(guild.id, entry.target.id)
+            warnings = actions.get(ActionType.WARNING, 0)
+            deleted_messages = (
+                actions.get(ActionType.MESSAGE_DELETE, 0)
+                + actions.get(ActionType.BULK_MESSAGE_DELETE, 0)
+                + (1 if action_type in (ActionType.MESSAGE_DELETE, ActionType.BULK_MESSAGE_DELETE) else 0)
+            )
+            timeouts = actions.get(ActionType.TIMEOUT, 0) + (1 if action_type == ActionType.TIMEOUT else 0)
+            kicks = actions.get(ActionType.KICK, 0) + (1 if action_type == ActionType.KICK else 0)
+            bans = actions.get(ActionType.BAN, 0) + (1 if action_type == ActionType.BAN else 0)
+            embed.set_footer(text=f"Warnings: {warnings} | Deleted Messages: {deleted_messages} | Timeouts: {timeouts} | Kicks: {kicks} | Bans: {bans}")
 
-    # Save the log to the database
+    # Save the log to the database, the log message ID is filled in once the dispatcher has sent it
     log_entry = Log(
         log_time=entry.created_at,
         guild_id=guild.id,
         mod_user_id=entry.user.id,
         target_user_id=entry.target.id if isinstance(entry.target, discord.Member) or isinstance(entry.target, discord.User) else None,
-        log_message_id=message.id if message else None,
         action_type=action_type,
-        log_data=log_data,
+        log_data=event.log_data,
     )
-    session.add(log_entry)
-    session.commit()
+    write_log(log_entry)
 
-    delete_old_logs()
-    await check_db_size()
+    if able_to_send:
+        comment = ""
+        if (
+                (action_type in need_reason and entry.reason is None) or
+                (not (isinstance(entry.target, discord.Member) or isinstance(entry.target, discord.User)))
+        ):
+            comment = f"Hey <@{entry.user.id}>, can you add some context to this action?"
+        log_dispatcher.send(log_channel, comment, embed=embed, logs=[log_entry])
 
 @bot.event
 async def on_message(message):
     if message.author.bot:
         return
 
+    if event_trace.enabled and message.guild is not None:
+        event_trace.message(message)
+
     try:
         ctx = await bot.get_context(message)
         if ctx.valid and await ctx.command.can_run(ctx):
@@ -555,6 +2224,31 @@ async def reload_servers(ctx: commands.Context) -> None:
     SERVERS = load_servers()
     await ctx.send(f"Servers reloaded.")
 
+@bot.command()
+@commands.is_owner()
+async def perf(ctx: commands.Context) -> None:
+    """Event loop lag, the slowest handler invocations with their phases and recent event loop stalls."""
+    lines = [
+        f"Event loop lag: {loop_watchdog.last_lag_seconds * 1000:.1f}ms (max {loop_watchdog.max_lag_seconds * 1000:.1f}ms)",
+        f"Log queue: {log_queue.depth} waiting, last flush {log_queue.last_flush_seconds * 1000:.1f}ms",
+        f"Log dispatcher: {log_dispatcher.backlog} waiting, last latency {log_dispatcher.last_latency_seconds:.2f}s",
+        "",
+        "Slowest invocations:",
+    ]
+    for profile in slow_invocations.slowest():
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in sorted(profile.phases.items(), key=lambda item: -item[1]))
+        lines.append(f"{profile.started_at:%Y-%m-%d %H:%M:%S} {profile.handler}: {profile.seconds * 1000:.0f}ms ({phases or 'no phases'})")
+    if loop_watchdog.stalls:
+        lines += ["", "Event loop stalls:"]
+        for stalled_at, blocked, stack in loop_watchdog.stalls:
+            lines += [f"{stalled_at:%Y-%m-%d %H:%M:%S} blocked for at least {blocked:.2f}s in:", stack]
+
+    report = "\n".join(lines)
+    if len(report) > 1900:
+        await ctx.send(file=discord.File(io.BytesIO(report.encode()), filename="perf.txt"))
+    else:
+        await ctx.send(f"```\n{report}\n```")
+
 @bot.tree.command(description="Log a warning to a user (does not send a message to the user)")
 @app_commands.guild_only()
 @app_commands.describe(
@@ -562,7 +2256,16 @@ async def reload_servers(ctx: commands.Context) -> None:
     reason="Reason for the warning",
     attachment="Attachment related to the warning (image, etc., optional)"
 )
+@instrumented("warn")
 async def warn(interaction: discord.Interaction, user: discord.Member, reason: str, attachment: discord.Attachment=None) -> None:
+    # Acknowledge straight away, downloading a large attachment can take longer than the interaction deadline
+    await interaction.response.defer(ephemeral=True)
+
+    max_attachment_mb = config.get("warn_attachment_max_mb", 25)
+    if attachment and attachment.size > max_attachment_mb * 1024 * 1024:
+        await interaction.followup.send(f"Attachment is larger than the {max_attachment_mb}MB limit. Warning not logged.", ephemeral=True)
+        return
+
     guild = interaction.guild
     log_channel = guild.get_channel(get_log_channel_id(guild.id))
 
@@ -586,9 +2289,12 @@ async def warn(interaction: discord.Interaction, user: discord.Member, reason: s
     embed.description += f"\n**Moderator:** {interaction.user.nick or interaction.user.display_name} (<@{interaction.user.id}>)"
     embed.description += f"\n**Reason:** {reason}"
 
+    # Download the attachment once, the same bytes are uploaded to the log channel and stored
+    attachment_data = None
     file = None
     if attachment:
-        file = await attachment.to_file()
+        attachment_data = await attachment.read()
+        file = discord.File(io.BytesIO(attachment_data), filename=attachment.filename, spoiler=attachment.is_spoiler())
         if file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
             embed.set_image(url=f"attachment://{file.filename}")
 
@@ -598,15 +2304,7 @@ async def warn(interaction: discord.Interaction, user: discord.Member, reason: s
     }
 
     if user:
-        results = (
-            session.query(Log.action_type, func.count(Log.action_type))
-            .filter(Log.guild_id == guild.id)
-            .filter(Log.target_user_id == user.id)
-            .filter(Log.log_time >= datetime.now() - timedelta(days=30))
-            .group_by(Log.action_type)
-            .all()
-        )
-        actions = {action_type: count for action_type, count in results}
+        actions = action_counters.get(guild.id, user.id)
         warnings = actions.get(ActionType.WARNING, 0) + 1
         deleted_messages = actions.get(ActionType.MESSAGE_DELETE, 0) + actions.get(ActionType.BULK_MESSAGE_DELETE, 0)
         timeouts = actions.get(ActionType.TIMEOUT, 0)
@@ -614,28 +2312,124 @@ async def warn(interaction: discord.Interaction, user: discord.Member, reason: s
         bans = actions.get(ActionType.BAN, 0)
         embed.set_footer(text=f"Warnings: {warnings} | Deleted Messages: {deleted_messages} | Timeouts: {timeouts} | Kicks: {kicks} | Bans: {bans}")
 
-    message = None
-    if able_to_send:
-        message = await log_channel.send(embed=embed, file=file)
+    # Store the attachment while the log message is sent
+    store_attachment = None
+    if attachment_data is not None:
+        store_attachment = asyncio.create_task(asyncio.to_thread(attachment_store.put, attachment_data))
 
-    # Save the log to the database
+    # Save the log to the database, the log message ID is filled in once the dispatcher has sent it
     log_entry = Log(
         log_time=interaction.created_at,
         guild_id=guild.id,
         mod_user_id=interaction.user.id,
         target_user_id=user.id,
-        log_message_id=message.id if message else None,
         action_type=ActionType.WARNING,
         log_data=log_data,
-        log_attachment=await attachment.read() if attachment else None,
     )
-    session.add(log_entry)
-    session.commit()
 
-    await interaction.response.send_message("Warning Logged", ephemeral=True)
+    if able_to_send:
+        log_dispatcher.send(log_channel, embed=embed, file=file, logs=[log_entry])
+
+    if store_attachment is not None:
+        log_entry.log_attachment_hash = await store_attachment
+    write_log(log_entry)
+
+    with profile_phase("send"):
+        await interaction.followup.send("Warning Logged", ephemeral=True)
+
+
+HISTORY_ACTION_TEXT = {
+    ActionType.BAN: "Ban",
+    ActionType.KICK: "Kick",
+    ActionType.TIMEOUT: "Timeout",
+    ActionType.MESSAGE_DELETE: "Message Deleted",
+    ActionType.BULK_MESSAGE_DELETE: "Bulk Message Delete",
+    ActionType.WARNING: "Warning",
+}
+
+class HistoryView(discord.ui.View):
+    """Pages through a user's history, fetching each page with keyset pagination only when it is first shown."""
+    PAGE_SIZE = 15
+
+    def __init__(self, interaction: discord.Interaction, guild_id: int, user_id: int, since: datetime, header: str):
+        super().__init__(timeout=300)
+        self.interaction = interaction
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.since = since
+        self.header = header
+        self.footer = ""
+        self.pages: List[list] = []
+        self.page = 0
+        self.has_more = False
+
+    async def _fetch_page(self, with_counts: bool = False) -> Dict[int, int]:
+        after = None
+        if self.pages:
+            last = self.pages[-1][-1]
+            after = (last.log_time, last.log_id)
+        # Fetch one extra row to know whether there is another page
+        rows, counts = await run_db(
+            get_history_page, self.guild_id, self.user_id, self.since, self.PAGE_SIZE + 1, after, with_counts
+        )
+        self.has_more = len(rows) > self.PAGE_SIZE
+        self.pages.append(rows[:self.PAGE_SIZE])
+        return counts
 
-    delete_old_logs()
-    await check_db_size()
+    async def load_first_page(self) -> discord.Embed:
+        actions = await self._fetch_page(with_counts=True)
+        warnings = actions.get(ActionType.WARNING, 0)
+        deleted_messages = actions.get(ActionType.MESSAGE_DELETE, 0) + actions.get(ActionType.BULK_MESSAGE_DELETE, 0)
+        timeouts = actions.get(ActionType.TIMEOUT, 0)
+        kicks = actions.get(ActionType.KICK, 0)
+        bans = actions.get(ActionType.BAN, 0)
+        self.footer = f"Warnings: {warnings} | Deleted Messages: {deleted_messages} | Timeouts: {timeouts} | Kicks: {kicks} | Bans: {bans}"
+        self._update_buttons()
+        return self.render()
+
+    def render(self) -> discord.Embed:
+        embed = discord.Embed(
+            timestamp=self.interaction.created_at,
+            title=f"📜 User History" + (f" (page {self.page + 1})" if len(self.pages) > 1 or self.has_more else ""),
+            description=self.header,
+            colour=discord.Colour.light_grey()
+        )
+        log_channel_id = get_log_channel_id(self.guild_id)
+        for item in self.pages[self.page]:
+            action_text = HISTORY_ACTION_TEXT[item.action_type]
+            if self.guild_id and log_channel_id and item.log_message_id:
+                embed.description += f"\n[{item.log_time.strftime('%Y-%m-%d')}] {action_text}:  https://discord.com/channels/{self.guild_id}/{log_channel_id}/{item.log_message_id}"
+            else:
+                embed.description += f"\n[{item.log_time.strftime('%Y-%m-%d')}] {action_text}"
+        embed.set_footer(text=self.footer)
+        return embed
+
+    def _update_buttons(self) -> None:
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page == len(self.pages) - 1 and not self.has_more
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.interaction.user.id
+
+    async def on_timeout(self) -> None:
+        try:
+            await self.interaction.edit_original_response(view=None)
+        except discord.HTTPException:
+            pass
+
+    @discord.ui.button(label="Previous", emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        self.page -= 1
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="Next", emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        if self.page == len(self.pages) - 1:
+            await self._fetch_page()
+        self.page += 1
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.render(), view=self)
 
 @bot.tree.command(description="View the moderation history of a user")
 @app_commands.guild_only()
@@ -643,6 +2437,7 @@ async def warn(interaction: discord.Interaction, user: discord.Member, reason: s
     user="User to view history for",
     days="Number of days to include in history (default: 30)"
 )
+@instrumented("history")
 async def history(
         interaction: discord.Interaction,
         user: discord.Member | discord.User,
@@ -651,87 +2446,37 @@ async def history(
     guild = interaction.guild
     log_channel = guild.get_channel(get_log_channel_id(guild.id))
 
-    oldest_log = session.query(Log).filter(Log.guild_id == guild.id).order_by(Log.log_time.asc()).first()
-    if oldest_log:
-        log_age_days = (datetime.now() - oldest_log.log_time).days
+    oldest_log_time = await run_db(get_oldest_log_time, guild.id)
+    if oldest_log_time:
+        log_age_days = (datetime.now() - oldest_log_time).days
         if days > log_age_days:
             days = log_age_days
 
     start_date = datetime.now() - timedelta(days=days)
     start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
 
-    embed = discord.Embed(
-        timestamp=interaction.created_at,
-        title=f"📜 User History",
-        description="",
-        colour=discord.Colour.light_grey()
-    )
+    header = ""
     mod = interaction.user
-    embed.description += f"**Requester:** {mod.nick or mod.display_name} (<@{mod.id}>)"
-    embed.description += f"\n**User:** {getattr(user, 'nick', None) or user.display_name} (<@{user.id}>)"
+    header += f"**Requester:** {mod.nick or mod.display_name} (<@{mod.id}>)"
+    header += f"\n**User:** {getattr(user, 'nick', None) or user.display_name} (<@{user.id}>)"
     if not isinstance(user, discord.Member):
-        embed.description += f"\n**User is not currently a member of this server**"
+        header += f"\n**User is not currently a member of this server**"
 
-    embed.description += f"\n**History since:** {start_date.strftime('%Y-%m-%d')}"
+    header += f"\n**History since:** {start_date.strftime('%Y-%m-%d')}"
 
-    user_history = (
-        session.query(Log)
-        .filter(Log.guild_id == guild.id)
-        .filter(Log.target_user_id == user.id)
-        .filter(Log.log_time >= start_date)
-        .all()
-    )
+    history_view = HistoryView(interaction, guild.id, user.id, start_date, header)
+    embed = await history_view.load_first_page()
+    view = history_view if history_view.has_more else None
 
-    for item in user_history:
-        action = item.action_type
-        action_text = None
-        if action == ActionType.BAN:
-            action_text = "Ban"
-        elif action == ActionType.KICK:
-            action_text = "Kick"
-        elif action == ActionType.TIMEOUT:
-            action_text = "Timeout"
-        elif action == ActionType.MESSAGE_DELETE:
-            action_text = "Message Deleted"
-        elif action == ActionType.BULK_MESSAGE_DELETE:
-            action_text = "Bulk Message Delete"
-        elif action == ActionType.WARNING:
-            action_text = "Warning"
-
-        if action_text:
-            if guild.id and get_log_channel_id(guild.id) and item.log_message_id:
-                embed.description += f"\n[{item.log_time.strftime('%Y-%m-%d')}] {action_text}:  https://discord.com/channels/{guild.id}/{get_log_channel_id(guild.id)}/{item.log_message_id}"
+    with profile_phase("send"):
+        if log_channel:
+            if interaction.channel.id == log_channel.id:
+                await interaction.response.send_message(embed=embed, view=view)
             else:
-                embed.description += f"\n[{item.log_time.strftime('%Y-%m-%d')}] {action_text}"
-
-    results = (
-        session.query(Log.action_type, func.count(Log.action_type))
-        .filter(Log.guild_id == guild.id)
-        .filter(Log.target_user_id == user.id)
-        .filter(Log.log_time >= start_date)
-        .group_by(Log.action_type)
-        .all()
-    )
-    actions = {action_type: count for action_type, count in results}
-    warnings = actions.get(ActionType.WARNING, 0)
-    deleted_messages = actions.get(ActionType.MESSAGE_DELETE, 0) + actions.get(ActionType.BULK_MESSAGE_DELETE, 0)
-    timeouts = actions.get(ActionType.TIMEOUT, 0)
-    kicks = actions.get(ActionType.KICK, 0)
-    bans = actions.get(ActionType.BAN, 0)
-    embed.set_footer(text=f"Warnings: {warnings} | Deleted Messages: {deleted_messages} | Timeouts: {timeouts} | Kicks: {kicks} | Bans: {bans}")
-
-    if log_channel:
-        if interaction.channel.id == log_channel.id:
-            await interaction.response.send_message(embed=embed)
+                log_dispatcher.send(log_channel, embed=embed)
+                await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
         else:
-            await log_channel.send(embed=embed)
-            await interaction.response.send_message(embed=embed, ephemeral=True)
-    else:
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-
-    delete_old_logs()
-    await check_db_size()
-
+            await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
 @bot.tree.command(description="Send a report to server staff")
 @app_commands.dm_only()
@@ -742,6 +2487,7 @@ async def history(
     message_link="Link to the message being reported (optional)",
     attachment="Attachment related to the report (optional)"
 )
+@instrumented("report")
 async def report(
         interaction: discord.Interaction,
         server: str,
@@ -791,11 +2537,12 @@ async def report(
     if attachment:
         embed.set_image(url=attachment.url)
 
-    if report_role_ping_id:
-        await report_channel.send(f"<@&{report_role_ping_id}> Member Report", embed=embed)
-    else:
-        await report_channel.send(embed=embed)
-    await interaction.response.send_message(f"Thank you for your report! It has been sent to the server staff.")
+    with profile_phase("send"):
+        if report_role_ping_id:
+            await report_channel.send(f"<@&{report_role_ping_id}> Member Report", embed=embed)
+        else:
+            await report_channel.send(embed=embed)
+        await interaction.response.send_message(f"Thank you for your report! It has been sent to the server staff.")
 
 @report.autocomplete('server')
 async def server_autocomplete(interaction: discord.Interaction, current: str) -> List[Choice[str]]:
@@ -820,6 +2567,76 @@ def str_to_msg_id(value: str) -> int | None:
             pass
     return None
 
+class ChannelPurge:
+    """Streams a channel's history and deletes matching messages as they are found.
+
+    Messages young enough for bulk deletion are deleted in batches of up to 100, older messages are deleted one by
+    one with at most `concurrency` requests in flight.
+    """
+    PROGRESS_INTERVAL = 2.0 # seconds between progress updates
+
+    def __init__(
+            self,
+            channel: discord.abc.Messageable,
+            check: Callable[[discord.Message], bool],
+            concurrency: int = 5,
+            on_progress: Optional[Callable[["ChannelPurge"], Awaitable[None]]] = None,
+    ):
+        self.channel = channel
+        self.check = check
+        self.on_progress = on_progress
+        self.scanned = 0
+        self.deleted: List[discord.Message] = []
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._batch: List[discord.Message] = []
+        self._single_deletes: List[asyncio.Task] = []
+        self._last_progress = time.monotonic()
+
+    async def run(
+            self,
+            match_limit: Optional[int] = None,
+            scan_limit: Optional[int] = None,
+            after: Optional[Snowflake] = None,
+            before: Optional[Snowflake] = None,
+    ) -> List[discord.Message]:
+        """Delete up to `match_limit` matching messages out of at most `scan_limit` scanned, returns the deleted messages."""
+        bulk_cutoff = discord.utils.utcnow() - MessageDeletionScheduler.BULK_DELETE_MAX_AGE
+        try:
+            async for message in self.channel.history(limit=scan_limit, after=after, before=before):
+                self.scanned += 1
+                if self.check(message):
+                    self.deleted.append(message)
+                    if message.created_at > bulk_cutoff:
+                        self._batch.append(message)
+                        if len(self._batch) >= MessageDeletionScheduler.BULK_DELETE_MAX:
+                            await self._delete_batch()
+                    else:
+                        self._single_deletes.append(asyncio.create_task(self._delete_single(message)))
+
+                if self.on_progress and time.monotonic() - self._last_progress >= self.PROGRESS_INTERVAL:
+                    self._last_progress = time.monotonic()
+                    await self.on_progress(self)
+
+                if match_limit is not None and len(self.deleted) >= match_limit:
+                    break
+
+            await self._delete_batch()
+            await asyncio.gather(*self._single_deletes)
+        finally:
+            for task in self._single_deletes:
+                task.cancel()
+        return self.deleted
+
+    async def _delete_batch(self) -> None:
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        await delete_messages(self.channel, batch)
+
+    async def _delete_single(self, message: discord.Message) -> None:
+        async with self._semaphore:
+            await delete_message(message)
+
 @bot.tree.command(description="Bulk delete messages in this channel")
 @app_commands.guild_only()
 @app_commands.checks.bot_has_permissions(view_channel=True, manage_messages=True, read_message_history=True)
@@ -828,8 +2645,9 @@ def str_to_msg_id(value: str) -> int | None:
     count="Number of messages to delete",
     start_message="Message ID or link to start purging from (inclusive)",
     end_message="Message ID or link to stop purging at (inclusive)",
-    user="Only delete messages sent by this user"
+    user="Only delete messages sent by this user (count is then the number of their messages to delete)"
 )
+@instrumented("purge")
 async def purge(
         interaction: discord.Interaction,
         reason: str,
@@ -866,11 +2684,31 @@ async def purge(
     channel = interaction.channel
     guild = interaction.guild
 
+    progress_message = await interaction.followup.send("Purging messages...", ephemeral=True, wait=True)
+
+    async def report_progress(channel_purge: ChannelPurge):
+        await progress_message.edit(content=f"Purging messages... scanned {channel_purge.scanned}, deleted {len(channel_purge.deleted)}")
+
+    scan_limit = None
+    channel_purge = ChannelPurge(
+        channel,
+        is_user,
+        concurrency=config.get("purge_delete_concurrency", 5),
+        on_progress=report_progress,
+    )
     try:
-        purged = await channel.purge(limit=count, after=start_message, before=end_message, check=is_user)
+        with profile_phase("message_delete"):
+            if user:
+                # With a user filter, count is the number of their messages to delete, not the number of messages to scan.
+                # Without a start message nothing else ends the scan, so it is capped in case the user has few messages.
+                if count is not None and start_message is None:
+                    scan_limit = count * config.get("purge_user_scan_factor", 20)
+                purged = await channel_purge.run(match_limit=count, scan_limit=scan_limit, after=start_message, before=end_message)
+            else:
+                purged = await channel_purge.run(scan_limit=count, after=start_message, before=end_message)
     except discord.Forbidden:
         print(f"Failed to purge messages in channel '{channel.name}' ({channel.id}) in guild '{guild.name}' ({guild.id}) due to a permissions error, despite the bot_has_permissions check passing (permissions may have changed mid-command).")
-        await interaction.followup.send("I don't have permission to delete messages in this channel. Please check my `View Channel`, `Manage Messages`, and `Read Message History` permissions.", ephemeral=True)
+        await progress_message.edit(content="I don't have permission to delete messages in this channel. Please check my `View Channel`, `Manage Messages`, and `Read Message History` permissions.")
         return
 
     log_channel = guild.get_channel(get_log_channel_id(guild.id))
@@ -897,7 +2735,24 @@ async def purge(
         else:
             users[msg.author] = [msg]
 
-    message = None
+    logs = []
+    if not ignored:
+        for author, msgs in users.items():
+            log_entry = Log(
+                log_time=interaction.created_at,
+                guild_id=guild.id,
+                mod_user_id=interaction.user.id,
+                target_user_id=author.id,
+                action_type=ActionType.BULK_MESSAGE_DELETE,
+                log_data={
+                    "channel_id": channel.id,
+                    "reason": reason,
+                    "message_count": len(msgs),
+                },
+            )
+            write_log(log_entry)
+            logs.append(log_entry)
+
     if able_to_send:
         embed = discord.Embed(
             timestamp=interaction.created_at,
@@ -910,6 +2765,16 @@ async def purge(
         embed.description += f"\n**Channel:** <#{channel.id}>"
         embed.description += f"\n**Reason:** {reason}"
 
+        # Resolve all unknown authors at once instead of one by one
+        unknown_authors = [
+            author for author in users
+            if not isinstance(author, (discord.Member, discord.User)) and hasattr(author, 'id')
+        ]
+        resolved_authors = dict(zip(
+            unknown_authors,
+            await asyncio.gather(*(user_resolver.resolve(author.id) for author in unknown_authors))
+        ))
+
         embed.description += "\n**Users:**"
         for author in users:
             if isinstance(author, discord.Member):
@@ -917,42 +2782,22 @@ async def purge(
             elif isinstance(author, discord.User):
                 embed.description += f"\n - {author.display_name} (<@{author.id}>): {len(users[author])}"
             elif hasattr(author, 'id'):
-                try:
-                    author = await bot.fetch_user(author.id)
-                    if author:
-                        embed.description += f"\n - {author.display_name} (<@{author.id}>): {len(users[author])}"
-                    else:
-                        embed.description += f"\n - <@{author.id}>: {len(users[author])}"
-                except discord.NotFound:
+                resolved_author = resolved_authors[author]
+                if resolved_author:
+                    embed.description += f"\n - {resolved_author.display_name} (<@{author.id}>): {len(users[author])}"
+                else:
                     embed.description += f"\n - <@{author.id}> (User not found): {len(users[author])}"
 
         comment = ""
         if reason is None:
             comment = f"Hey <@{interaction.user.id}>, can you add some context to this action?"
-        message = await log_channel.send(comment, embed=embed)
+        log_dispatcher.send(log_channel, comment, embed=embed, logs=logs)
 
-    if not ignored:
-        for author, msgs in users.items():
-            log_entry = Log(
-                log_time=interaction.created_at,
-                guild_id=guild.id,
-                mod_user_id=interaction.user.id,
-                target_user_id=author.id,
-                log_message_id=message.id if message else None,
-                action_type=ActionType.BULK_MESSAGE_DELETE,
-                log_data={
-                    "channel_id": channel.id,
-                    "reason": reason,
-                    "message_count": len(msgs),
-                },
-            )
-            session.add(log_entry)
-        session.commit()
-
-    await interaction.followup.send(f"deleted {len(purged)} messages", ephemeral=True)
+    if scan_limit is not None and channel_purge.scanned >= scan_limit and len(purged) < count:
+        await progress_message.edit(content=f"deleted {len(purged)} messages, stopped after scanning the last {channel_purge.scanned} messages without finding {count} from {user.mention}")
+    else:
+        await progress_message.edit(content=f"deleted {len(purged)} messages")
 
-    delete_old_logs()
-    await check_db_size()
 
 @purge.error
 async def purge_error(interaction: discord.Interaction, error: app_commands.AppCommandError) -> None:
@@ -970,9 +2815,19 @@ async def version(interaction: discord.Interaction) -> None:
     await interaction.response.send_message(f"Bot online\nVersion: {VERSION}\nBuild date: {BUILD_DATE}")
 
 if __name__ == "__main__":
-    upgrade_db()
-    verify_db_tables(engine.connect(), Base.metadata)
+    # The revision check is enough when nothing changed, the full check diffs and reflects the whole schema
+    full_schema_check = config.get("db_full_schema_check", False)
+    with startup_phase("Database upgrade"):
+        up_to_date = upgrade_db(full_schema_check)
+    if full_schema_check or not up_to_date:
+        with startup_phase("Schema verification"):
+            with engine.connect() as conn:
+                verify_db_tables(conn, Base.metadata)
 
     # global SERVERS
-    SERVERS = load_servers()
-    bot.run(BOT_TOKEN)
+    with startup_phase("Loading servers"):
+        SERVERS = load_servers()
+    try:
+        bot.run(BOT_TOKEN)
+    finally:
+        db_executor.shutdown(wait=True)
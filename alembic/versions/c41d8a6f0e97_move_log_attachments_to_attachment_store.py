@@ -0,0 +1,134 @@
+"""Move log attachments to the attachment store
+
+Revision ID: c41d8a6f0e97
+Revises: 7f2e4b9c1a83
+Create Date: 2026-10-16 23:21:05.664318
+
+"""
+import hashlib
+import os
+import tempfile
+import zlib
+from typing import Optional, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import yaml
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41d8a6f0e97'
+down_revision: Union[str, Sequence[str], None] = '7f2e4b9c1a83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Number of attachments held in memory at once while moving them
+CHUNK_SIZE = 50
+
+logs = sa.table(
+    'logs',
+    sa.column('log_id', sa.Integer()),
+    sa.column('log_attachment', sa.LargeBinary()),
+    sa.column('log_attachment_hash', sa.String(64)),
+)
+
+
+# The layout of ModLogBot's FileAttachmentStore as of this revision. Alembic loads every migration script on
+# startup, so importing the bot from here would import it a second time.
+COMPRESSED_SUFFIX = '.z'
+
+
+def get_attachment_store() -> tuple[str, bool]:
+    """The attachment store folder and whether attachments are compressed, from the bot's config.yml."""
+    config_folder_path = os.environ.get('CONFIG_FOLDER_PATH', '/config/')
+    config = {}
+    if os.path.exists(f'{config_folder_path}config.yml'):
+        with open(f'{config_folder_path}config.yml', mode='r') as f:
+            config = yaml.safe_load(f) or {}
+    return f'{config_folder_path}attachments', config.get('attachment_compression', False)
+
+
+def put_attachment(root: str, compress: bool, data: bytes) -> str:
+    key = hashlib.sha256(data).hexdigest()
+    path = os.path.join(root, key[:2], key)
+    if os.path.exists(path) or os.path.exists(path + COMPRESSED_SUFFIX):
+        return key
+
+    if compress:
+        data = zlib.compress(data)
+        path += COMPRESSED_SUFFIX
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return key
+
+
+def get_attachment(root: str, key: str) -> Optional[bytes]:
+    path = os.path.join(root, key[:2], key)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    if os.path.exists(path + COMPRESSED_SUFFIX):
+        with open(path + COMPRESSED_SUFFIX, 'rb') as f:
+            return zlib.decompress(f.read())
+    return None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # ModLogBot runs create_all() before upgrading, which does not add columns to an existing table
+    if 'log_attachment_hash' not in {column['name'] for column in sa.inspect(bind).get_columns('logs')}:
+        with op.batch_alter_table('logs', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('log_attachment_hash', sa.String(length=64), nullable=True))
+
+    root, compress = get_attachment_store()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(logs.c.log_id, logs.c.log_attachment)
+            .where(logs.c.log_id > last_id)
+            .where(logs.c.log_attachment.isnot(None))
+            .order_by(logs.c.log_id)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        for log_id, data in rows:
+            bind.execute(
+                logs.update().where(logs.c.log_id == log_id).values(log_attachment_hash=put_attachment(root, compress, data))
+            )
+        last_id = rows[-1].log_id
+
+    with op.batch_alter_table('logs', schema=None) as batch_op:
+        batch_op.drop_column('log_attachment')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('logs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('log_attachment', sa.LargeBinary(), nullable=True))
+
+    bind = op.get_bind()
+    root, _ = get_attachment_store()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(logs.c.log_id, logs.c.log_attachment_hash)
+            .where(logs.c.log_id > last_id)
+            .where(logs.c.log_attachment_hash.isnot(None))
+            .order_by(logs.c.log_id)
+            .limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        for log_id, key in rows:
+            bind.execute(
+                logs.update().where(logs.c.log_id == log_id).values(log_attachment=get_attachment(root, key))
+            )
+        last_id = rows[-1].log_id
+
+    with op.batch_alter_table('logs', schema=None) as batch_op:
+        batch_op.drop_column('log_attachment_hash')
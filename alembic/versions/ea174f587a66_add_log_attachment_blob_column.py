@@ -22,7 +22,7 @@ def upgrade() -> None:
     """Upgrade schema."""
     # ### commands auto generated by Alembic - please adjust! ###
     with op.batch_alter_table('logs', schema=None) as batch_op:
-        batch_op.add_column(sa.Column('log_attachment', sa.BLOB(), nullable=True))
+        batch_op.add_column(sa.Column('log_attachment', sa.LargeBinary(), nullable=True))
 
     # ### end Alembic commands ###
 
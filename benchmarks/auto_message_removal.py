@@ -0,0 +1,87 @@
+"""Micro-benchmark for handle_auto_message_removal.
+
+Compares the precompiled, channel-indexed rules against the previous approach of walking every rule in the guild
+and calling re.match with the raw pattern strings.
+
+Run from the repository root:
+    python benchmarks/auto_message_removal.py
+"""
+import asyncio
+import re
+import time
+
+from common import ModLogBot
+
+GUILD_ID = 1
+BUSY_CHANNEL_ID = 100
+QUIET_CHANNEL_ID = 999
+MESSAGES = 200_000
+
+
+class FakeObject:
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeMessage:
+    def __init__(self, id, channel_id, content):
+        self.id = id
+        self.guild = FakeObject(GUILD_ID)
+        self.channel = FakeObject(channel_id)
+        self.content = content
+
+    async def reply(self, *args, **kwargs):
+        return self
+
+    async def delete(self, *args, **kwargs):
+        pass
+
+
+def build_rules():
+    configs = []
+    # 50 other channels with a rule each, plus three rules on the busy channel
+    for channel_id in range(200, 250):
+        configs.append(ModLogBot.Config_AutoMessageRemoval(channel_id=channel_id, regex_matching=r"^!"))
+    configs.append(ModLogBot.Config_AutoMessageRemoval(channel_id=BUSY_CHANNEL_ID, regex_not_matching=r"^https?://\S+$"))
+    configs.append(ModLogBot.Config_AutoMessageRemoval(channel_id=BUSY_CHANNEL_ID, regex_matching=r".*discord\.gg/"))
+    configs.append(ModLogBot.Config_AutoMessageRemoval(channel_id=BUSY_CHANNEL_ID, regex_matching=r"^\s*$"))
+    return configs
+
+
+async def previous_handler(configs, message):
+    for auto_message_removal in configs:
+        if message.channel.id == auto_message_removal.channel_id:
+            if auto_message_removal.regex_matching is not None and re.match(auto_message_removal.regex_matching, message.content) is None:
+                return
+            if auto_message_removal.regex_not_matching is not None and re.match(auto_message_removal.regex_not_matching, message.content) is not None:
+                return
+            await message.delete(delay=auto_message_removal.removal_delay_seconds)
+
+
+async def measure(name, handler, messages):
+    start = time.perf_counter()
+    for message in messages:
+        await handler(message)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {len(messages) / elapsed:>12,.0f} messages/sec")
+
+
+async def main():
+    configs = build_rules()
+    rules = {}
+    for config in configs:
+        rule = ModLogBot.AutoMessageRemovalRule(config)
+        rules.setdefault(rule.channel_id, []).append(rule)
+    ModLogBot.SERVERS = {GUILD_ID: {"auto_message_removals": rules}}
+
+    busy = [FakeMessage(i, BUSY_CHANNEL_ID, "https://example.com/some/link" if i % 4 else "hello there") for i in range(MESSAGES)]
+    quiet = [FakeMessage(i, QUIET_CHANNEL_ID, "just chatting") for i in range(MESSAGES)]
+
+    await measure("busy channel, previous", lambda m: previous_handler(configs, m), busy)
+    await measure("busy channel, precompiled", ModLogBot.handle_auto_message_removal, busy)
+    await measure("channel without rules, previous", lambda m: previous_handler(configs, m), quiet)
+    await measure("channel without rules, precompiled", ModLogBot.handle_auto_message_removal, quiet)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
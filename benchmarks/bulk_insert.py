@@ -0,0 +1,85 @@
+"""Benchmark for multi-row log writes.
+
+Compares rows/sec of the per-object `session.add` path against `insert_logs`, the Core executemany path used by the
+write-behind queue.
+
+Run from the repository root:
+    python benchmarks/bulk_insert.py
+"""
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from common import ModLogBot, CONFIG_FOLDER
+
+Log = ModLogBot.Log
+ROW_COUNTS = [10, 1_000, 100_000]
+# Committing every row costs an fsync each, only measure it where it finishes in reasonable time
+MAX_ROWS_COMMIT_EACH = 1_000
+
+
+def make_rows(count):
+    now = datetime.now()
+    return [
+        {
+            "log_time": now,
+            "guild_id": 1,
+            "mod_user_id": 2,
+            "target_user_id": 3 + i % 50,
+            "log_message_id": None,
+            "action_type": ModLogBot.ActionType.BULK_MESSAGE_DELETE,
+            "log_data": {"channel_id": 4, "reason": "benchmark", "message_count": 1},
+            "log_attachment_hash": None,
+        }
+        for i in range(count)
+    ]
+
+
+def fresh_session(name):
+    path = os.path.join(CONFIG_FOLDER, f"{name}.db")
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    ModLogBot.Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)()
+
+
+def orm_commit_each(session, rows):
+    for row in rows:
+        session.add(Log(**row))
+        session.commit()
+
+
+def orm_add(session, rows):
+    for row in rows:
+        session.add(Log(**row))
+    session.commit()
+
+
+def core_insert(session, rows):
+    ModLogBot.insert_logs(session, rows)
+
+
+def measure(name, func, count):
+    session = fresh_session(name)
+    rows = make_rows(count)
+    start = time.perf_counter()
+    func(session, rows)
+    elapsed = time.perf_counter() - start
+    session.close()
+    print(f"{name:<24} {count:>8,} rows {count / elapsed:>14,.0f} rows/sec")
+
+
+def main():
+    for count in ROW_COUNTS:
+        if count <= MAX_ROWS_COMMIT_EACH:
+            measure("session.add, commit each", orm_commit_each, count)
+        measure("session.add, one commit", orm_add, count)
+        measure("insert_logs", core_insert, count)
+
+
+if __name__ == "__main__":
+    main()
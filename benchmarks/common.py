@@ -0,0 +1,26 @@
+"""Shared setup for the benchmarks: imports ModLogBot against a throwaway config folder."""
+import atexit
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG_FOLDER = tempfile.mkdtemp(prefix="modlog_bench_")
+atexit.register(shutil.rmtree, CONFIG_FOLDER, ignore_errors=True)
+os.environ["CONFIG_FOLDER_PATH"] = CONFIG_FOLDER + os.sep
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+
+# ModLogBot copies config.example.yml relative to the working directory on first start
+os.chdir(REPO_ROOT)
+sys.path.insert(0, REPO_ROOT)
+
+import ModLogBot
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of `values`, 0.0 when there are none."""
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(len(values) * fraction) - 1)] if values else 0.0
@@ -0,0 +1,191 @@
+"""Stand-ins for the discord.py objects the handlers touch.
+
+Everything that would be a REST call goes through `FakeDiscordAPI`, which counts the call and waits a configurable
+latency instead of talking to Discord.
+"""
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+
+
+class FakeDiscordAPI:
+    """Local replacement for Discord's HTTP API: counts requests per route and waits `latency` seconds on each."""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._ids = itertools.count()
+
+    async def request(self, route):
+        self.calls[route] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def snowflake(self, created_at=None):
+        # Unique and ordered by time like real snowflakes, the low bits are a counter
+        created_at = created_at or discord.utils.utcnow()
+        return discord.utils.time_snowflake(created_at) + next(self._ids) % (1 << 22)
+
+    async def fetch_user(self, user_id):
+        await self.request("GET /users/{user_id}")
+        return make_user(user_id)
+
+
+def make_user(id):
+    """A real `discord.User`, for the code paths that check the type of the target."""
+    return discord.User(state=None, data={"id": id, "username": f"user{id}", "discriminator": "0", "avatar": None, "global_name": None})
+
+
+class FakeUser:
+    """Stands in for the `discord.Member` moderators and authors, which need a guild and connection state."""
+    def __init__(self, id, name=None):
+        self.id = id
+        self.name = name or f"user{id}"
+        self.display_name = self.name
+        self.nick = None
+        self.bot = False
+        self.mention = f"<@{id}>"
+
+
+class FakeMessage:
+    def __init__(self, api, channel, author, content="", created_at=None, id=None):
+        self.api = api
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.created_at = created_at or discord.utils.utcnow()
+        self.id = id or api.snowflake(self.created_at)
+
+    async def delete(self, delay=None):
+        await self.api.request("DELETE /channels/{channel_id}/messages/{message_id}")
+
+    async def edit(self, **kwargs):
+        await self.api.request("PATCH /channels/{channel_id}/messages/{message_id}")
+        return self
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content)
+
+
+class FakeTextChannel:
+    def __init__(self, api, guild, id, name="channel"):
+        self.api = api
+        self.guild = guild
+        self.id = id
+        self.name = name
+        self.mention = f"<#{id}>"
+        self.messages = []
+
+    def permissions_for(self, member):
+        return SimpleNamespace(send_messages=True, embed_links=True, manage_messages=True, read_message_history=True)
+
+    async def send(self, content=None, *, embed=None, embeds=None, file=None, **kwargs):
+        await self.api.request("POST /channels/{channel_id}/messages")
+        return FakeMessage(self.api, self, self.guild.me, content or "")
+
+    async def delete_messages(self, messages):
+        await self.api.request("POST /channels/{channel_id}/messages/bulk-delete")
+
+    async def history(self, limit=100, after=None, before=None):
+        # Newest first, like the real history with no `after`
+        count = 0
+        for message in reversed(self.messages):
+            if before is not None and message.id >= before.id:
+                continue
+            if after is not None and message.id <= after.id:
+                break
+            if count % 100 == 0:
+                await self.api.request("GET /channels/{channel_id}/messages")
+            yield message
+            count += 1
+            if limit is not None and count >= limit:
+                break
+
+    def fill(self, authors, count, max_age=timedelta(days=1)):
+        """Add `count` messages from `authors` spread evenly over the last `max_age`, oldest first."""
+        now = discord.utils.utcnow()
+        step = max_age / max(count, 1)
+        for i in range(count):
+            self.messages.append(FakeMessage(self.api, self, authors[i % len(authors)], f"message {i}", now - max_age + step * i))
+
+
+class FakeGuild:
+    def __init__(self, api, id, name="guild"):
+        self.api = api
+        self.id = id
+        self.name = name
+        self.me = FakeUser(1, "ModLogBot")
+        self.channels = {}
+
+    def add_channel(self, id, name="channel"):
+        channel = self.channels[id] = FakeTextChannel(self.api, self, id, name)
+        return channel
+
+    def get_channel(self, id):
+        return self.channels.get(id)
+
+
+class FakeAttachment:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.data = data
+        self.size = len(data)
+        self.url = f"https://cdn.example.invalid/{filename}"
+
+    async def read(self):
+        return self.data
+
+    def is_spoiler(self):
+        return False
+
+
+class FakeResponse:
+    def __init__(self, api):
+        self.api = api
+
+    async def defer(self, **kwargs):
+        await self.api.request("POST /interactions/{interaction_id}/{token}/callback")
+
+    async def send_message(self, content=None, **kwargs):
+        await self.api.request("POST /interactions/{interaction_id}/{token}/callback")
+
+    async def edit_message(self, **kwargs):
+        await self.api.request("POST /interactions/{interaction_id}/{token}/callback")
+
+
+class FakeFollowup:
+    def __init__(self, api, channel):
+        self.api = api
+        self.channel = channel
+
+    async def send(self, content=None, wait=False, **kwargs):
+        await self.api.request("POST /webhooks/{application_id}/{token}")
+        return FakeMessage(self.api, self.channel, self.channel.guild.me, content or "")
+
+
+class FakeInteraction:
+    def __init__(self, api, guild, channel, user):
+        self.guild = guild
+        self.channel = channel
+        self.user = user
+        self.created_at = discord.utils.utcnow()
+        self.response = FakeResponse(api)
+        self.followup = FakeFollowup(api, channel)
+
+
+class FakeAuditLogEntry:
+    """An audit log entry whose target is only known by ID, like entries for users missing from the cache."""
+    def __init__(self, action, guild, user, target_id, reason=None, extra=None, before=None, after=None):
+        self.action = action
+        self.guild = guild
+        self.user = user
+        self.target = discord.Object(id=target_id)
+        self.reason = reason
+        self.extra = extra
+        self.before = before
+        self.after = after
+        self.created_at = datetime.now(timezone.utc)
@@ -0,0 +1,221 @@
+"""End-to-end benchmark of the event and command handlers against fake Discord objects.
+
+Drives `on_audit_log_entry_create`, `warn`, `history`, `purge` and `handle_auto_message_removal` the way the gateway
+would, with every REST call answered by `FakeDiscordAPI`. The database is pre-seeded with `--rows` logs so the
+queries run against a realistically sized table. Reports events/sec, p50/p99 latency and the peak RSS of the process.
+
+Run from the repository root:
+    python benchmarks/hot_paths.py --rows 10000
+    python benchmarks/hot_paths.py --rows 5000000 --events 2000 --rest-latency 0.05
+"""
+import argparse
+import asyncio
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+
+from common import ModLogBot, percentile
+from fakes import FakeDiscordAPI, FakeGuild, FakeUser, FakeInteraction, FakeAuditLogEntry, FakeAttachment, FakeMessage, make_user
+
+GUILD_ID = 1000
+LOG_CHANNEL_ID = 2000
+CHAT_CHANNEL_ID = 2001
+PURGE_CHANNEL_ID = 2002
+TARGET_USERS = 5000
+MODERATORS = 20
+SEED_CHUNK = 10_000
+
+ACTION_WEIGHTS = {
+    ModLogBot.ActionType.MESSAGE_DELETE: 50,
+    ModLogBot.ActionType.TIMEOUT: 20,
+    ModLogBot.ActionType.WARNING: 15,
+    ModLogBot.ActionType.BULK_MESSAGE_DELETE: 8,
+    ModLogBot.ActionType.KICK: 4,
+    ModLogBot.ActionType.BAN: 3,
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def seed(rows, retention_days):
+    """Insert `rows` logs spread over the retention period, in chunks through `insert_logs`."""
+    random.seed(0)
+    action_types = list(ACTION_WEIGHTS)
+    weights = list(ACTION_WEIGHTS.values())
+    now = datetime.now()
+    start = time.perf_counter()
+    with ModLogBot.Session() as session:
+        for offset in range(0, rows, SEED_CHUNK):
+            chunk = []
+            for _ in range(min(SEED_CHUNK, rows - offset)):
+                action_type = random.choices(action_types, weights)[0]
+                chunk.append({
+                    "log_time": now - timedelta(seconds=random.uniform(0, retention_days * 86400)),
+                    "guild_id": GUILD_ID,
+                    "mod_user_id": 10 + random.randrange(MODERATORS),
+                    "target_user_id": 100 + random.randrange(TARGET_USERS),
+                    "log_message_id": random.getrandbits(62),
+                    "action_type": action_type,
+                    "log_data": {"reason": "seeded", "channel_id": CHAT_CHANNEL_ID},
+                    "log_attachment_hash": None,
+                })
+            ModLogBot.insert_logs(session, chunk)
+    elapsed = time.perf_counter() - start
+    print(f"seeded {rows:,} logs in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/sec)")
+
+
+def build_guild(api):
+    guild = FakeGuild(api, GUILD_ID, "benchmark")
+    guild.add_channel(LOG_CHANNEL_ID, "mod-log")
+    guild.add_channel(CHAT_CHANNEL_ID, "general")
+    guild.add_channel(PURGE_CHANNEL_ID, "spam")
+    rule = ModLogBot.AutoMessageRemovalRule(ModLogBot.Config_AutoMessageRemoval(
+        channel_id=CHAT_CHANNEL_ID, regex_matching=r".*discord\.gg/", removal_delay_seconds=60, response_message="No invites",
+    ))
+    ModLogBot.SERVERS = {GUILD_ID: {
+        "name": "benchmark",
+        "log_channel_id": LOG_CHANNEL_ID,
+        "report_channel_id": None,
+        "report_role_ping_id": None,
+        "ignored_channels": [],
+        "auto_message_removals": {CHAT_CHANNEL_ID: [rule]},
+        "message_delete_coalesce_seconds": 0,
+    }}
+    return guild
+
+
+def audit_entry(guild, moderators, i):
+    moderator = moderators[i % len(moderators)]
+    target_id = 100 + random.randrange(TARGET_USERS)
+    kind = i % 10
+    if kind < 5:
+        return FakeAuditLogEntry(
+            discord.AuditLogAction.message_delete, guild, moderator, target_id,
+            extra=SimpleNamespace(channel=guild.get_channel(CHAT_CHANNEL_ID), count=1),
+        )
+    if kind < 8:
+        until = datetime.now(timezone.utc) + timedelta(hours=1)
+        return FakeAuditLogEntry(
+            discord.AuditLogAction.member_update, guild, moderator, target_id, reason="spam",
+            before=SimpleNamespace(timed_out_until=None), after=SimpleNamespace(timed_out_until=until),
+        )
+    if kind < 9:
+        return FakeAuditLogEntry(discord.AuditLogAction.kick, guild, moderator, target_id, reason="raid")
+    return FakeAuditLogEntry(discord.AuditLogAction.ban, guild, moderator, target_id, reason="raid")
+
+
+async def measure(name, calls, concurrency):
+    """Await each of `calls` with at most `concurrency` running at once, then report throughput and latency."""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(call):
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(call) for call in calls))
+    # Count the time it takes to get the queued log messages and rows out as part of the run
+    await ModLogBot.log_dispatcher.drain(timeout=300)
+    await ModLogBot.log_queue.flush()
+    elapsed = time.perf_counter() - start
+
+    p50 = percentile(latencies, 0.5) * 1000
+    p99 = percentile(latencies, 0.99) * 1000
+    print(f"{name:<26} {len(calls):>7,} events {len(calls) / elapsed:>10,.0f} events/sec  "
+          f"p50 {p50:>8.2f}ms  p99 {p99:>8.2f}ms  peak RSS {peak_rss_mb():>7.1f}MB")
+
+
+async def run(args):
+    api = FakeDiscordAPI(latency=args.rest_latency)
+    ModLogBot.bot.fetch_user = api.fetch_user
+    guild = build_guild(api)
+    moderators = [FakeUser(10 + i) for i in range(MODERATORS)]
+    # The dispatcher's rate limit is Discord's, not the fake API's, lift it to measure the bot itself
+    ModLogBot.log_dispatcher.rate = args.events
+
+    start = time.perf_counter()
+    await ModLogBot.action_counters.rebuild()
+    print(f"action counters rebuilt in {time.perf_counter() - start:.2f}s, peak RSS {peak_rss_mb():.1f}MB")
+
+    # The deletion scheduler waits for the gateway, scheduled removals only go onto its heap here
+    ModLogBot.log_queue.start()
+    try:
+        events = args.events
+        await measure("on_audit_log_entry_create", [
+            (lambda entry=audit_entry(guild, moderators, i): ModLogBot.on_audit_log_entry_create(entry))
+            for i in range(events)
+        ], args.concurrency)
+
+        log_channel = guild.get_channel(LOG_CHANNEL_ID)
+        await measure("warn", [
+            (lambda i=i: ModLogBot.warn.callback(
+                FakeInteraction(api, guild, log_channel, moderators[i % MODERATORS]),
+                FakeUser(100 + random.randrange(TARGET_USERS)),
+                "benchmark",
+                FakeAttachment("evidence.png", bytes(64 * 1024)) if i % 10 == 0 else None,
+            ))
+            for i in range(events)
+        ], args.concurrency)
+
+        await measure("history", [
+            (lambda i=i: ModLogBot.history.callback(
+                FakeInteraction(api, guild, log_channel, moderators[i % MODERATORS]),
+                make_user(100 + random.randrange(TARGET_USERS)),
+                90,
+            ))
+            for i in range(events)
+        ], args.concurrency)
+
+        chat = guild.get_channel(CHAT_CHANNEL_ID)
+        authors = [FakeUser(100 + i) for i in range(50)]
+        await measure("handle_auto_message_removal", [
+            (lambda message=FakeMessage(api, chat, authors[i % len(authors)], "join discord.gg/spam" if i % 20 == 0 else "hello"):
+                ModLogBot.handle_auto_message_removal(message))
+            for i in range(events * 10)
+        ], args.concurrency)
+
+        purge_channel = guild.get_channel(PURGE_CHANNEL_ID)
+        purges = max(1, events // 100)
+        purge_channel.fill(authors, purges * args.purge_size, max_age=timedelta(days=20))
+        await measure("purge", [
+            (lambda i=i: ModLogBot.purge.callback(
+                FakeInteraction(api, guild, purge_channel, moderators[i % MODERATORS]),
+                "benchmark",
+                args.purge_size,
+            ))
+            for i in range(purges)
+        ], 1)
+    finally:
+        await ModLogBot.log_queue.stop()
+
+    print("REST calls: " + ", ".join(f"{route} {count:,}" for route, count in api.calls.most_common()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000, help="logs to seed the database with (10k to 5M)")
+    parser.add_argument("--events", type=int, default=2_000, help="events per handler")
+    parser.add_argument("--concurrency", type=int, default=50, help="events handled at the same time")
+    parser.add_argument("--rest-latency", type=float, default=0.0, help="seconds the fake API waits on every request")
+    parser.add_argument("--purge-size", type=int, default=500, help="messages per /purge")
+    args = parser.parse_args()
+
+    ModLogBot.upgrade_db()
+    seed(args.rows, ModLogBot.config.get("db_log_retention_days", 90))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
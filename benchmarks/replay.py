@@ -0,0 +1,239 @@
+"""Record and replay harness for load testing with real or synthetic gateway traffic.
+
+Traces are the JSONL files written by the bot when `event_trace_path` is set, or made up by `synthesize`. `replay`
+feeds a trace into the handlers at its recorded pace, optionally sped up, against fake guilds whose REST calls are
+answered by `FakeDiscordAPI`. It reports the end-to-end lag from each event to its log channel post and to the commit
+of its log row.
+
+Run from the repository root:
+    python benchmarks/replay.py synthesize raid.jsonl --guilds 3 --events 600 --duration 60
+    python benchmarks/replay.py replay raid.jsonl --speed 10 --rest-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import discord
+
+from common import ModLogBot, percentile
+from fakes import FakeDiscordAPI, FakeGuild, FakeTextChannel, FakeUser, FakeAuditLogEntry, FakeMessage
+
+# Fake log channels get small IDs, far below any real snowflake or the IDs `synthesize` uses
+LOG_CHANNEL_ID_BASE = 1
+
+
+def synthesize(args):
+    """Write a raid: bans, timeouts and message deletes across several guilds, with invite spam in between."""
+    random.seed(args.seed)
+    start = time.time()
+    records = []
+    for _ in range(args.events):
+        t = round(start + random.uniform(0, args.duration), 3)
+        guild = 1000 + random.randrange(args.guilds)
+        channel = guild * 10 + 2
+        moderator = 10 + random.randrange(5)
+        raider = 100_000 + random.randrange(args.events // 2 + 1)
+        kind = random.random()
+        if kind < 0.3:
+            records.append({"t": t, "type": "audit", "guild": guild, "action": discord.AuditLogAction.ban.value,
+                            "user": moderator, "target": raider, "reason": "raid"})
+        elif kind < 0.55:
+            until = datetime.fromtimestamp(t + 86400, timezone.utc).isoformat()
+            records.append({"t": t, "type": "audit", "guild": guild, "action": discord.AuditLogAction.member_update.value,
+                            "user": moderator, "target": raider, "reason": "raid", "changes": {"timed_out_until": [None, until]}})
+        elif kind < 0.8:
+            records.append({"t": t, "type": "audit", "guild": guild, "action": discord.AuditLogAction.message_delete.value,
+                            "user": moderator, "target": raider, "reason": None, "channel": channel, "count": 1})
+        else:
+            records.append({"t": t, "type": "message", "guild": guild, "channel": channel, "author": raider,
+                            "content": "free nitro discord.gg/raid"})
+    records.sort(key=lambda record: record["t"])
+    with open(args.trace, mode="w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+    print(f"wrote {len(records):,} events over {args.duration}s to {args.trace}")
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def describe_lags(name, lags):
+    if not lags:
+        print(f"{name:<18} no samples")
+        return
+    print(f"{name:<18} {len(lags):>7,} samples  p50 {percentile(lags, 0.5) * 1000:>9.1f}ms  "
+          f"p99 {percentile(lags, 0.99) * 1000:>9.1f}ms  max {max(lags) * 1000:>9.1f}ms")
+
+
+class RecordingChannel(FakeTextChannel):
+    """Log channel that measures how long each posted embed took from its event, using the embed timestamp."""
+    def __init__(self, api, guild, id, lags):
+        super().__init__(api, guild, id, "mod-log")
+        self.lags = lags
+
+    async def send(self, content=None, *, embed=None, embeds=None, file=None, **kwargs):
+        message = await super().send(content, embed=embed, embeds=embeds, file=file, **kwargs)
+        now = discord.utils.utcnow()
+        for sent in embeds or [embed]:
+            if sent is not None and sent.timestamp is not None:
+                self.lags.append((now - sent.timestamp).total_seconds())
+        return message
+
+
+class Replay:
+    def __init__(self, records, api):
+        self.records = records
+        self.api = api
+        self.guilds = {}
+        self.post_lags = []
+        self.commit_lags = []
+
+    def setup(self):
+        """Create a fake guild for every guild in the trace, with an invite filter on every channel messages were seen in."""
+        channels = {}
+        for record in self.records:
+            channels.setdefault(record["guild"], set())
+            if "channel" in record:
+                channels[record["guild"]].add((record["channel"], record["type"] == "message"))
+
+        servers = {}
+        for index, (guild_id, guild_channels) in enumerate(channels.items()):
+            guild = self.guilds[guild_id] = FakeGuild(self.api, guild_id, f"guild {guild_id}")
+            log_channel_id = LOG_CHANNEL_ID_BASE + index
+            guild.channels[log_channel_id] = RecordingChannel(self.api, guild, log_channel_id, self.post_lags)
+            rules = {}
+            for channel_id, has_messages in guild_channels:
+                guild.add_channel(channel_id)
+                if has_messages:
+                    rules[channel_id] = [ModLogBot.AutoMessageRemovalRule(ModLogBot.Config_AutoMessageRemoval(
+                        channel_id=channel_id, regex_matching=r".*discord\.gg/", removal_delay_seconds=60,
+                    ))]
+            servers[guild_id] = {
+                "name": guild.name,
+                "log_channel_id": log_channel_id,
+                "report_channel_id": None,
+                "report_role_ping_id": None,
+                "ignored_channels": [],
+                "auto_message_removals": rules,
+                "message_delete_coalesce_seconds": ModLogBot.config.get("message_delete_coalesce_seconds", 0),
+            }
+        ModLogBot.SERVERS = servers
+
+        # Log rows carry the event time, the lag is known as soon as their batch is committed
+        save_logs = ModLogBot.save_logs
+
+        def timed_save_logs(session, logs, sent=()):
+            save_logs(session, logs, sent)
+            now = datetime.now(timezone.utc)
+            self.commit_lags.extend((now - log.log_time).total_seconds() for log in logs)
+        ModLogBot.save_logs = timed_save_logs
+
+    def audit_entry(self, record):
+        guild = self.guilds[record["guild"]]
+        changes = record.get("changes", {})
+        before = SimpleNamespace()
+        after = SimpleNamespace()
+        for name, (old, new) in changes.items():
+            if name == "timed_out_until":
+                old = datetime.fromisoformat(old) if old else None
+                new = datetime.fromisoformat(new) if new else None
+            setattr(before, name, old)
+            setattr(after, name, new)
+        extra = None
+        if "channel" in record:
+            extra = SimpleNamespace(channel=guild.get_channel(record["channel"]), count=record.get("count", 1))
+        return FakeAuditLogEntry(
+            discord.AuditLogAction(record["action"]), guild, FakeUser(record["user"]), record["target"],
+            reason=record.get("reason"), extra=extra, before=before, after=after,
+        )
+
+    def message(self, record):
+        channel = self.guilds[record["guild"]].get_channel(record["channel"])
+        return FakeMessage(self.api, channel, FakeUser(record["author"]), record.get("content", ""))
+
+    async def dispatch(self, record):
+        # Objects are built when the event is due, so their timestamps are the replayed arrival times
+        if record["type"] == "audit":
+            await ModLogBot.on_audit_log_entry_create(self.audit_entry(record))
+        elif record["type"] == "message":
+            await ModLogBot.handle_guild_message(self.message(record))
+
+    async def run(self, speed):
+        t0 = self.records[0]["t"]
+        start = time.monotonic()
+        tasks = []
+        for record in self.records:
+            delay = start + (record["t"] - t0) / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Each gateway event is handled in its own task, like discord.py dispatches them
+            tasks.append(asyncio.create_task(self.dispatch(record)))
+        await asyncio.gather(*tasks)
+        dispatched = time.monotonic() - start
+
+        await ModLogBot.message_delete_coalescer.flush()
+        await ModLogBot.log_dispatcher.drain(timeout=3600)
+        await ModLogBot.log_queue.flush()
+        return dispatched, time.monotonic() - start
+
+
+async def replay(args):
+    records = load_trace(args.trace)
+    if not records:
+        print(f"{args.trace} has no events")
+        return
+    api = FakeDiscordAPI(latency=args.rest_latency)
+    ModLogBot.bot.fetch_user = api.fetch_user
+    session = Replay(records, api)
+    session.setup()
+
+    trace_seconds = records[-1]["t"] - records[0]["t"]
+    print(f"replaying {len(records):,} events from {len(session.guilds)} guilds, "
+          f"{trace_seconds:.1f}s of trace at {args.speed}x")
+    ModLogBot.log_queue.start()
+    try:
+        dispatched, finished = await session.run(args.speed)
+    finally:
+        await ModLogBot.log_queue.stop()
+
+    print(f"events dispatched in {dispatched:.1f}s, everything posted and committed after {finished:.1f}s")
+    describe_lags("event to post", session.post_lags)
+    describe_lags("event to commit", session.commit_lags)
+    stats = ModLogBot.log_dispatcher.stats()
+    print(f"log messages sent {stats['sent_messages']:,} for {stats['sent_embeds']:,} embeds, "
+          f"{stats['packed_messages']:,} packed")
+    print("REST calls: " + ", ".join(f"{route} {count:,}" for route, count in api.calls.most_common()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    synthesize_parser = commands.add_parser("synthesize", help="write a synthetic raid trace")
+    synthesize_parser.add_argument("trace")
+    synthesize_parser.add_argument("--guilds", type=int, default=3)
+    synthesize_parser.add_argument("--events", type=int, default=600)
+    synthesize_parser.add_argument("--duration", type=float, default=60.0, help="seconds the raid lasts")
+    synthesize_parser.add_argument("--seed", type=int, default=0)
+
+    replay_parser = commands.add_parser("replay", help="feed a trace into the handlers")
+    replay_parser.add_argument("trace")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="1 replays in real time, 10 ten times faster")
+    replay_parser.add_argument("--rest-latency", type=float, default=0.0, help="seconds the fake API waits on every request")
+
+    args = parser.parse_args()
+    if args.command == "synthesize":
+        synthesize(args)
+    else:
+        ModLogBot.upgrade_db()
+        asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark of commit latency under each SQLite profile.
+
+Every commit inserts a single log row, the way a lone moderation action is written.
+
+Run from the repository root:
+    python benchmarks/sqlite_profiles.py
+"""
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+from common import ModLogBot, CONFIG_FOLDER, percentile
+
+COMMITS = 500
+
+
+def measure(profile):
+    path = os.path.join(CONFIG_FOLDER, f"profile_{profile}.db")
+    engine = create_engine(f"sqlite:///{path}")
+    ModLogBot.apply_sqlite_pragmas(engine, ModLogBot.SQLITE_PROFILES[profile])
+    ModLogBot.Base.metadata.create_all(engine)
+
+    row = {
+        "log_time": datetime.now(),
+        "guild_id": 1,
+        "mod_user_id": 2,
+        "target_user_id": 3,
+        "log_message_id": None,
+        "action_type": ModLogBot.ActionType.WARNING,
+        "log_data": {"reason": "benchmark"},
+        "log_attachment_hash": None,
+    }
+    latencies = []
+    with engine.connect() as conn:
+        for _ in range(COMMITS):
+            start = time.perf_counter()
+            conn.execute(ModLogBot.Log.__table__.insert(), row)
+            conn.commit()
+            latencies.append(time.perf_counter() - start)
+    engine.dispose()
+
+    p50 = percentile(latencies, 0.5) * 1000
+    p99 = percentile(latencies, 0.99) * 1000
+    print(f"{profile:<12} p50 {p50:>8.3f}ms  p99 {p99:>8.3f}ms  {COMMITS / sum(latencies):>10,.0f} commits/sec")
+
+
+def main():
+    for profile in ModLogBot.SQLITE_PROFILES:
+        measure(profile)
+
+
+if __name__ == "__main__":
+    main()
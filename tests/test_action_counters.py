@@ -0,0 +1,90 @@
+"""The in-memory footer counts must match the aggregate over the logs table."""
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+import ModLogBot
+from ModLogBot import ActionCounters, ActionType, Log
+
+GUILDS = [1000, 1001]
+TARGET_USERS = range(100, 120)
+ACTION_TYPES = [ActionType.BAN, ActionType.KICK, ActionType.TIMEOUT, ActionType.WARNING, ActionType.MESSAGE_DELETE]
+
+
+@pytest.fixture
+def Session(db_engine, monkeypatch):
+    Session = sessionmaker(bind=db_engine, expire_on_commit=False)
+    monkeypatch.setattr(ModLogBot, "Session", Session)
+    return Session
+
+
+def make_log(log_time: datetime) -> Log:
+    return Log(
+        log_time=log_time,
+        guild_id=random.choice(GUILDS),
+        mod_user_id=10,
+        # Logs without a target are never counted
+        target_user_id=random.choice([*TARGET_USERS, None]),
+        action_type=random.choice(ACTION_TYPES),
+        log_data={},
+    )
+
+
+def expected_counts(Session, window: timedelta) -> dict:
+    """Per-user action counts over the days in `window`, straight from the database."""
+    first_day = datetime.combine((datetime.now() - window).date(), datetime.min.time())
+    with Session() as session:
+        rows = session.execute(
+            sa.select(Log.guild_id, Log.target_user_id, Log.action_type, sa.func.count())
+            .where(Log.log_time >= first_day, Log.target_user_id.isnot(None))
+            .group_by(Log.guild_id, Log.target_user_id, Log.action_type)
+        ).all()
+    counts = {}
+    for guild_id, target_user_id, action_type, count in rows:
+        counts.setdefault((guild_id, target_user_id), {})[action_type] = count
+    return counts
+
+
+def counter_counts(counters: ActionCounters) -> dict:
+    counts = {}
+    for guild_id in GUILDS:
+        for target_user_id in TARGET_USERS:
+            user_counts = counters.get(guild_id, target_user_id)
+            if user_counts:
+                counts[(guild_id, target_user_id)] = user_counts
+    return counts
+
+
+def test_counts_match_the_database(Session):
+    random.seed(0)
+    now = datetime.now()
+    with Session() as session:
+        ModLogBot.save_logs(session, [make_log(now - timedelta(seconds=random.uniform(0, 45 * 86400))) for _ in range(3000)])
+
+    counters = ActionCounters(window=timedelta(days=30))
+    asyncio.run(counters.rebuild())
+    assert counter_counts(counters) == expected_counts(Session, counters.window)
+
+    new_logs = [make_log(datetime.now()) for _ in range(200)]
+    for log in new_logs:
+        counters.record(log.guild_id, log.target_user_id, log.action_type, log.log_time)
+    with Session() as session:
+        ModLogBot.save_logs(session, new_logs)
+    assert counter_counts(counters) == expected_counts(Session, counters.window)
+
+    # A shorter window expires the older days the same way time passing does
+    counters.window = timedelta(days=10)
+    assert counter_counts(counters) == expected_counts(Session, counters.window)
+    counters.window = timedelta(0)
+    assert counter_counts(counters) == expected_counts(Session, counters.window)
+
+
+def test_logs_before_the_window_are_ignored():
+    counters = ActionCounters(window=timedelta(days=30))
+    counters.record(GUILDS[0], TARGET_USERS[0], ActionType.BAN, datetime.now() - timedelta(days=40))
+    counters.record(GUILDS[0], TARGET_USERS[0], ActionType.KICK, datetime.now())
+    assert counters.get(GUILDS[0], TARGET_USERS[0]) == {ActionType.KICK: 1}
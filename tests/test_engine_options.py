@@ -0,0 +1,15 @@
+"""The connection pool and the database threads must agree on the pool size."""
+import ModLogBot
+
+
+def test_blank_pool_size_uses_the_default(monkeypatch):
+    # config.example.yml used to leave db_pool_size blank, which loads as None
+    monkeypatch.setitem(ModLogBot.config, "db_pool_size", None)
+    assert ModLogBot.get_db_pool_size() == 5
+    assert ModLogBot.get_engine_options()["pool_size"] == 5
+
+
+def test_pool_size_from_config(monkeypatch):
+    monkeypatch.setitem(ModLogBot.config, "db_pool_size", 12)
+    monkeypatch.setitem(ModLogBot.config, "db_max_overflow", None)
+    assert ModLogBot.get_engine_options() == {"pool_size": 12}
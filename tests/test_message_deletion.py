@@ -0,0 +1,43 @@
+"""Scheduled deletions that fail must stay pending instead of being dropped with the rest of their channel."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+
+import ModLogBot
+from ModLogBot import MessageDeletionScheduler
+
+
+def http_error(cls, status: int):
+    return cls(SimpleNamespace(status=status, reason=cls.__name__), cls.__name__)
+
+
+class FakeChannel:
+    def __init__(self, failing: dict):
+        self.failing = failing
+        self.deleted = []
+
+    async def delete_messages(self, messages):
+        raise http_error(discord.Forbidden, 403)
+
+    def get_partial_message(self, message_id):
+        async def delete():
+            if message_id in self.failing:
+                raise self.failing[message_id]
+            self.deleted.append(message_id)
+        return SimpleNamespace(id=message_id, delete=delete)
+
+
+def message_id(age: timedelta) -> int:
+    return discord.utils.time_snowflake(datetime.now(timezone.utc) - age)
+
+
+def test_failed_deletions_are_not_removed(monkeypatch):
+    deleted, gone, forbidden, old = (message_id(timedelta(hours=hours)) for hours in (1, 2, 3, 24 * 20))
+    channel = FakeChannel({gone: http_error(discord.NotFound, 404), forbidden: http_error(discord.Forbidden, 403)})
+    monkeypatch.setattr(ModLogBot.bot, "get_channel", lambda channel_id: channel)
+
+    removed = asyncio.run(MessageDeletionScheduler()._delete(1, [deleted, gone, forbidden, old]))
+    assert channel.deleted == [old, deleted]
+    assert sorted(removed) == sorted([deleted, gone, old])
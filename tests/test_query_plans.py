@@ -0,0 +1,111 @@
+"""The hot queries must be answered from the logs indexes, without scanning the table or sorting in a temp B-tree."""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+
+import ModLogBot
+from ModLogBot import ActionType
+
+GUILD_ID = 1000
+TARGET_USER_ID = 100
+
+HISTORY_INDEX = "ix_logs_guild_target_time"
+OLDEST_LOG_INDEX = "ix_logs_guild_time"
+RETENTION_INDEX = "ix_logs_log_time"
+
+
+@pytest.fixture
+def session(sqlite_engine):
+    random.seed(0)
+    now = datetime.now()
+    rows = [{
+        "log_time": now - timedelta(seconds=random.uniform(0, 90 * 86400)),
+        "guild_id": GUILD_ID + random.randrange(3),
+        "mod_user_id": 10,
+        "target_user_id": TARGET_USER_ID + random.randrange(50),
+        "log_message_id": None,
+        "action_type": random.choice([ActionType.BAN, ActionType.KICK, ActionType.TIMEOUT, ActionType.WARNING]),
+        "log_data": {},
+        "log_attachment_hash": None,
+    } for _ in range(2000)]
+    with sessionmaker(bind=sqlite_engine)() as session:
+        ModLogBot.insert_logs(session, rows)
+        yield session
+
+
+def query_plan(session, func, *args) -> str:
+    """Run `func(session, *args)` and return the EXPLAIN QUERY PLAN of the last statement it executed."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    sa.event.listen(session.bind, "before_cursor_execute", capture)
+    try:
+        func(session, *args)
+    finally:
+        sa.event.remove(session.bind, "before_cursor_execute", capture)
+    statement, parameters = statements[-1]
+    rows = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def assert_uses_index(plan: str, index: str) -> None:
+    assert f"USING INDEX {index}" in plan or f"USING COVERING INDEX {index}" in plan, plan
+    assert "SCAN logs" not in plan, plan
+    assert "TEMP B-TREE" not in plan, plan
+
+
+def test_history_first_page(session):
+    plan = query_plan(
+        session, ModLogBot.get_history_page, GUILD_ID, TARGET_USER_ID, datetime.now() - timedelta(days=90), 11, None, True,
+    )
+    assert_uses_index(plan, HISTORY_INDEX)
+
+
+def test_history_later_page(session):
+    rows, _ = ModLogBot.get_history_page(session, GUILD_ID, TARGET_USER_ID, datetime.now() - timedelta(days=90), 11)
+    after = (rows[-1].log_time, rows[-1].log_id)
+    plan = query_plan(
+        session, ModLogBot.get_history_page, GUILD_ID, TARGET_USER_ID, datetime.now() - timedelta(days=90), 11, after,
+    )
+    assert_uses_index(plan, HISTORY_INDEX)
+
+
+def test_history_pages_are_complete(session):
+    since = datetime.now() - timedelta(days=90)
+    seen = []
+    after = None
+    while True:
+        rows, _ = ModLogBot.get_history_page(session, GUILD_ID, TARGET_USER_ID, since, 7, after)
+        seen += [row.log_id for row in rows]
+        if len(rows) < 7:
+            break
+        after = (rows[-1].log_time, rows[-1].log_id)
+
+    expected = session.execute(
+        sa.select(ModLogBot.Log.log_id)
+        .where(ModLogBot.Log.guild_id == GUILD_ID, ModLogBot.Log.target_user_id == TARGET_USER_ID)
+        .order_by(ModLogBot.Log.log_time, ModLogBot.Log.log_id)
+    ).scalars().all()
+    assert seen == expected
+
+
+def test_oldest_log_time(session):
+    plan = query_plan(session, ModLogBot.get_oldest_log_time, GUILD_ID)
+    assert_uses_index(plan, OLDEST_LOG_INDEX)
+
+
+def test_recent_action_counts(session):
+    plan = query_plan(session, ModLogBot.get_recent_action_counts, datetime.now() - timedelta(days=30))
+    # Only run at startup, grouping the window's logs by day needs a sort
+    assert f"USING INDEX {RETENTION_INDEX}" in plan, plan
+    assert "SCAN logs" not in plan, plan
+
+
+def test_retention(session):
+    plan = query_plan(session, ModLogBot.delete_old_logs, datetime.now() - timedelta(days=60), 1000)
+    assert_uses_index(plan, RETENTION_INDEX)
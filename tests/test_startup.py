@@ -0,0 +1,44 @@
+"""Startup on an up-to-date database must only compare revisions, without upgrading or importing the bot again."""
+import subprocess
+import sys
+
+import pytest
+from alembic import command as alembic_command
+
+import ModLogBot
+from conftest import REPO_ROOT, alembic_config
+
+
+@pytest.fixture
+def upgrades(sqlite_engine, monkeypatch):
+    """Point upgrade_db() at the migrated test database and record the upgrades it runs instead of running them."""
+    monkeypatch.setattr(ModLogBot, "engine", sqlite_engine)
+    monkeypatch.setattr(ModLogBot, "DB_URL", str(sqlite_engine.url))
+    monkeypatch.setattr(ModLogBot, "new_db", False)
+    monkeypatch.setattr(ModLogBot, "db_backup", None)
+    calls = []
+    monkeypatch.setattr(alembic_command, "upgrade", lambda config, revision: calls.append(revision))
+    return calls
+
+
+def test_up_to_date_database_is_not_upgraded(upgrades):
+    assert ModLogBot.upgrade_db() is True
+    assert upgrades == []
+
+
+def test_out_of_date_database_is_upgraded(sqlite_engine, upgrades):
+    alembic_command.stamp(alembic_config(str(sqlite_engine.url)), "c41d8a6f0e97")
+    assert ModLogBot.upgrade_db() is False
+    assert upgrades == ["head"]
+
+
+def test_reading_the_migration_heads_does_not_import_the_bot():
+    code = (
+        "import sys\n"
+        "from alembic.config import Config\n"
+        "from alembic.script import ScriptDirectory\n"
+        "ScriptDirectory.from_config(Config('alembic.ini')).get_heads()\n"
+        "print('ModLogBot' in sys.modules)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"